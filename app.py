@@ -8,11 +8,44 @@ from fastapi.middleware.cors import CORSMiddleware
 
 import motor.motor_asyncio
 
+from util.audit import AuditWriter
+from util.change_feed import ChangeFeed
+from util.rollup import BagRollup
+from util.tombstone import TOMBSTONE_TTL
+from util.compression import CompressionMiddleware
+from util.idempotency import IDEMPOTENCY_TTL, IdempotencyMiddleware
+from util.profiler import ProfilerMiddleware
+from util.rate_limit import InMemoryRateLimitBackend, MongoRateLimitBackend
+
 
 # Load project environment
 dotenv_path = Path(".env")
 load_dotenv(dotenv_path=dotenv_path)
 
+mongodb_uri = str(os.getenv("MONGODB_URI"))
+
+# Admin token for the profiler, profiling is disabled without it
+profile_token = os.getenv("PROFILE_TOKEN") or None
+
+
+# Create a shared database connection. Each worker process gets its own pool:
+# `connect=False` defers connecting until first use, so a client created
+# before gunicorn forks the workers is never shared between them.
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    mongodb_uri,
+    connect=False,
+    maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", "100")),
+    minPoolSize=int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+)
+db = client.test_db
+bag_collection = db.get_collection("bags")
+box_collection = db.get_collection("boxes")
+officer_collection = db.get_collection("officers")
+prisoner_collection = db.get_collection("prisoners")
+shelf_collection = db.get_collection("shelves")
+tombstone_collection = db.get_collection("tombstones")
+idempotency_collection = db.get_collection("idempotency_keys")
+
 app = FastAPI(
     title="IMSE4135",
     summary="Backend for IMSE4135 project.",
@@ -24,25 +57,129 @@ origins = [
     "*"
 ]
 
+# Middleware added last runs first: responses replayed for an Idempotency-Key
+# still get CORS headers and compression
+# Bulk imports stream their upload to a spool file and are not buffered by it
+app.add_middleware(
+    IdempotencyMiddleware, collection=idempotency_collection, exclude=["/bulk/"]
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Idempotent-Replayed"],
 )
 
-mongodb_uri = str(os.getenv("MONGODB_URI"))
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
 
+# Outermost, so a profiled request covers all the other middleware
+app.add_middleware(ProfilerMiddleware, token=profile_token, exclude=["/profile"])
+
+
+@app.on_event("startup")
+async def create_indexes():
+    # `last_updated` backs delta sync (GET /sync), which pages through
+    # (`last_updated`, `_id`)
+    for collection in (
+        bag_collection,
+        box_collection,
+        prisoner_collection,
+        shelf_collection,
+    ):
+        await collection.create_index([("last_updated", 1), ("_id", 1)])
+    # Foreign keys used by the lookup routes
+    await bag_collection.create_index("box_id")
+    await bag_collection.create_index("prisoner_id")
+    # Registration day ranges recomputed by the report rollup
+    await bag_collection.create_index("date_registered")
+    await box_collection.create_index("shelf_id")
+    await officer_collection.create_index("officer_id")
+    await prisoner_collection.create_index("officer_id")
+    await tombstone_collection.create_index(
+        "deleted_at", expireAfterSeconds=int(TOMBSTONE_TTL.total_seconds())
+    )
+    # Deletions paged through by delta sync
+    await tombstone_collection.create_index([("deleted_at", 1), ("_id", 1)])
+    # Newest deletion per collection, for list ETags
+    await tombstone_collection.create_index([("collection", 1), ("deleted_at", -1)])
+    await idempotency_collection.create_index(
+        "created_at", expireAfterSeconds=int(IDEMPOTENCY_TTL.total_seconds())
+    )
+
+# Token buckets for rate limits. Set RATE_LIMIT_BACKEND=mongo to share them
+# between workers and instances, otherwise each worker keeps its own.
+if os.getenv("RATE_LIMIT_BACKEND") == "mongo":
+    rate_limit_backend = MongoRateLimitBackend(db.get_collection("rate_limits"))
+else:
+    rate_limit_backend = InMemoryRateLimitBackend()
+
+# Requests per second and burst per client address. Clients behind one NAT or
+# proxy share a bucket, so these are sized for a site rather than a device.
+list_bags_rate = float(os.getenv("LIST_BAGS_RATE", "5"))
+list_bags_burst = int(os.getenv("LIST_BAGS_BURST", "20"))
+ml_rate = float(os.getenv("ML_RATE", "0.5"))
+ml_burst = int(os.getenv("ML_BURST", "5"))
+
+
+@app.on_event("startup")
+async def create_rate_limit_indexes():
+    if isinstance(rate_limit_backend, MongoRateLimitBackend):
+        await rate_limit_backend.create_indexes()
+
+
+# One change stream per worker, shared by all event subscribers
+change_feed = ChangeFeed(db, ["bags", "boxes", "prisoners", "shelves"])
+
+
+@app.on_event("startup")
+async def enable_change_feed_pre_images():
+    await change_feed.enable_pre_images()
+
+
+@app.on_event("shutdown")
+async def stop_change_feed():
+    await change_feed.stop()
+
+
+# Audit log entries are queued by the routes and written in batches
+audit_writer = AuditWriter(db)
+
+
+@app.on_event("startup")
+async def start_audit_writer():
+    await audit_writer.create_collection()
+    audit_writer.start()
+
+
+@app.on_event("shutdown")
+async def stop_audit_writer():
+    await audit_writer.stop()
+
+
+# Report rollups, refreshed in the background by whichever worker holds the lease
+bag_rollup = BagRollup(db, bag_collection, tombstone_collection)
+
+
+@app.on_event("startup")
+async def start_bag_rollup():
+    await bag_rollup.create_indexes()
+    bag_rollup.start()
+
+
+@app.on_event("shutdown")
+async def stop_bag_rollup():
+    await bag_rollup.stop()
+
+
+# Registered last, so it runs after the other shutdown handlers are done with
+# the database
+@app.on_event("shutdown")
+async def close_client():
+    client.close()
 
-# Create a shared database connection
-client = motor.motor_asyncio.AsyncIOMotorClient(mongodb_uri)
-db = client.test_db
-bag_collection = db.get_collection("bags")
-box_collection = db.get_collection("boxes")
-officer_collection = db.get_collection("officers")
-prisoner_collection = db.get_collection("prisoners")
-shelf_collection = db.get_collection("shelves")
 
 # Include the shelf routes
 from routes.shelf import shelf_router
@@ -51,10 +188,22 @@ from routes.box import box_router
 from routes.officer import officer_router
 from routes.prisoner import prisoner_router
 from routes.ml import ml_router
+from routes.events import events_router
+from routes.sync import sync_router
+from routes.audit import audit_router
+from routes.report import report_router
+from routes.bulk import bulk_router
+from routes.profile import profile_router
 
 app.include_router(shelf_router)
 app.include_router(bag_router)
 app.include_router(box_router)
 app.include_router(officer_router)
 app.include_router(prisoner_router)
-app.include_router(ml_router)
\ No newline at end of file
+app.include_router(ml_router)
+app.include_router(events_router)
+app.include_router(sync_router)
+app.include_router(audit_router)
+app.include_router(report_router)
+app.include_router(bulk_router)
+app.include_router(profile_router)
@@ -0,0 +1,99 @@
+"""
+Throughput of bulk export and import, against a database seeded by `bench.seed`.
+
+    python -m bench.bulk_io [--rows 1000000] [--formats csv parquet]
+
+Exports the first `--rows` bags to a temporary file in each format, then
+imports that file into a scratch collection, which is dropped afterwards.
+Reports rows/second for each step and the size of each file.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import motor.motor_asyncio
+from dotenv import load_dotenv
+
+from util import bulk_io
+from util.bulk_io import BULK_COLLECTIONS, import_file, iter_export
+
+
+class Limited:
+    """
+    Read-only view of a collection that only returns its first `limit`
+    documents, so exports can be sized.
+    """
+
+    def __init__(self, collection, limit):
+        self.collection = collection
+        self.limit = limit
+
+    def find(self, *args, **kwargs):
+        return self.collection.find(*args, **kwargs).limit(self.limit)
+
+
+async def measure(step, rows, coro):
+    start = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - start
+    print(f"{step:<16} {rows / elapsed:>12,.0f} rows/s {elapsed:>8.1f}s")
+    return result
+
+
+async def export_to(path, collection, fmt, batch_size):
+    with open(path, "wb") as output:
+        async for chunk in iter_export(
+            collection, BULK_COLLECTIONS["bags"], fmt, batch_size
+        ):
+            output.write(chunk)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--formats", nargs="+", default=["csv", "parquet"])
+    parser.add_argument("--batch-size", type=int, default=bulk_io.BATCH_SIZE)
+    parser.add_argument("--database", default="test_db")
+    args = parser.parse_args()
+
+    load_dotenv(Path(".env"))
+    client = motor.motor_asyncio.AsyncIOMotorClient(os.getenv("MONGODB_URI"))
+    db = client[args.database]
+    rows = min(args.rows, await db.bags.estimated_document_count())
+    bags = Limited(db.bags, rows)
+    scratch = db.get_collection("bench_bulk_import")
+    print(f"{rows:,} bags, batches of {args.batch_size:,}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in args.formats:
+            if fmt == "parquet" and bulk_io.pyarrow is None:
+                print("parquet          skipped, pyarrow is not installed")
+                continue
+            path = Path(directory) / f"bags.{fmt}"
+            await measure(
+                f"export {fmt}", rows, export_to(path, bags, fmt, args.batch_size)
+            )
+            print(f"{'':<16} {path.stat().st_size / 2**20:>12,.1f} MiB")
+
+            await scratch.drop()
+            with open(path, "rb") as file:
+                result = await measure(
+                    f"import {fmt}",
+                    rows,
+                    import_file(
+                        scratch,
+                        BULK_COLLECTIONS["bags"],
+                        file,
+                        fmt,
+                        batch_size=args.batch_size,
+                    ),
+                )
+            print(f"{'':<16} {result['inserted']:>12,} inserted")
+        await scratch.drop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
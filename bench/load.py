@@ -0,0 +1,398 @@
+"""
+Load generator for the API, against a database seeded by `bench.seed`.
+
+    python -m bench.load --url http://localhost:8000 --mix read-heavy \
+        --concurrency 32 --duration 60 [--images DIR] [--output results.json] \
+        [--save-baseline bench/baseline-read-heavy.json] \
+        [--baseline bench/baseline-read-heavy.json]
+
+Each worker picks operations by weight from the selected mix and records
+per-operation latencies. The report gives p50/p95/p99 and throughput per
+operation. With `--baseline`, results are compared against a stored run and
+the exit status is non-zero if any operation regressed by more than
+`--tolerance`.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from bench.seed import (
+    MANIFEST,
+    bag_epc,
+    box_id,
+    officer_code,
+    prisoner_number,
+    shelf_id,
+)
+from util.create_objectid import create_objectid
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+# Operation weights per mix. Every router in routes/ is covered by at least
+# one mix.
+MIXES = {
+    "read-heavy": {
+        "list_bags": 2,
+        "show_bag": 20,
+        "bags_by_box": 10,
+        "bags_by_prisoner": 10,
+        "lookup_bags": 5,
+        "list_boxes": 2,
+        "show_box": 10,
+        "boxes_in_shelf": 5,
+        "list_shelves": 2,
+        "show_shelf": 5,
+        "list_prisoners": 1,
+        "show_prisoner": 10,
+        "lookup_prisoners": 3,
+        "prisoners_by_officer": 3,
+        "list_officers": 1,
+        "show_officer": 5,
+        "sync": 1,
+        "events": 1,
+    },
+    "write-heavy": {
+        "create_bag": 30,
+        "update_bag": 20,
+        "update_box": 10,
+        "move_boxes": 2,
+        "update_shelf": 2,
+        "update_prisoner": 10,
+        "update_officer": 2,
+        "login": 5,
+        "show_bag": 19,
+    },
+    "intake": {
+        "login": 5,
+        "show_prisoner": 20,
+        "lookup_bags": 10,
+        "create_bag": 40,
+        "show_box": 15,
+        "bags_by_prisoner": 10,
+    },
+    "ml": {
+        "ml_json": 3,
+        "ml_img": 1,
+    },
+}
+
+
+class Workload:
+    """
+    Builds requests for each operation against the seeded id ranges.
+    """
+
+    def __init__(self, counts, images, rng, run_id, worker_id):
+        self.counts = counts
+        self.images = images
+        self.rng = rng
+        self.epc_prefix = f"L{run_id}{worker_id:02d}"
+        self.created = 0
+
+    def pick(self, kind):
+        return self.rng.randrange(self.counts[kind])
+
+    def bag(self):
+        return str(create_objectid(bag_epc(self.pick("bags"))))
+
+    def prisoner(self):
+        return str(create_objectid(prisoner_number(self.pick("prisoners"))))
+
+    def officer(self):
+        return officer_code(self.pick("officers"))
+
+    def box(self):
+        return str(box_id(self.pick("boxes")))
+
+    def shelf(self):
+        return str(shelf_id(self.pick("shelves")))
+
+    def bag_body(self, epc):
+        return {
+            "rfid_epc": epc,
+            "box_id": self.box(),
+            "items": ["2 pens", "1 notebook"],
+            "officer_id": self.officer(),
+            "prisoner_id": self.prisoner(),
+            "last_updated_by": self.officer(),
+        }
+
+    def request(self, op):
+        """Return (method, url, kwargs) for an operation."""
+        if op == "list_bags":
+            return "GET", "/bags/", {}
+        if op == "show_bag":
+            return "GET", f"/bags/{self.bag()}", {}
+        if op == "bags_by_box":
+            return "GET", f"/bags/box/{self.box()}", {}
+        if op == "bags_by_prisoner":
+            return "GET", f"/bags/prisoner/{self.prisoner()}", {}
+        if op == "lookup_bags":
+            epcs = [bag_epc(self.pick("bags")) for _ in range(50)]
+            return "POST", "/bags/lookup", {"json": {"rfid_epcs": epcs}}
+        if op == "create_bag":
+            # 12 bytes at most: "L" + run id + worker id + counter
+            self.created += 1
+            epc = f"{self.epc_prefix}{self.created:06d}"
+            return "POST", "/bags/", {"json": self.bag_body(epc)}
+        if op == "update_bag":
+            i = self.pick("bags")
+            body = self.bag_body(bag_epc(i))
+            return "PUT", f"/bags/{create_objectid(bag_epc(i))}", {"json": body}
+        if op == "list_boxes":
+            return "GET", "/boxes/", {}
+        if op == "show_box":
+            return "GET", f"/boxes/{self.box()}", {}
+        if op == "boxes_in_shelf":
+            return "GET", f"/boxes/shelf/{self.shelf()}", {}
+        if op == "update_box":
+            body = {"last_date_accessed": "2024-01-01T00:00:00Z"}
+            return "PUT", f"/boxes/{self.box()}", {"json": body}
+        if op == "move_boxes":
+            body = {
+                "box_ids": [self.box() for _ in range(20)],
+                "shelf_id": self.shelf(),
+                "last_updated_by": str(create_objectid(self.officer())),
+            }
+            return "POST", "/boxes/move", {"json": body}
+        if op == "list_shelves":
+            return "GET", "/shelves/", {}
+        if op == "show_shelf":
+            return "GET", f"/shelves/{self.shelf()}", {}
+        if op == "update_shelf":
+            body = {"shelf_name": f"Shelf {self.rng.randrange(1000)}"}
+            return "PUT", f"/shelves/{self.shelf()}", {"json": body}
+        if op == "list_prisoners":
+            return "GET", "/prisoners/", {}
+        if op == "show_prisoner":
+            return "GET", f"/prisoners/{self.prisoner()}", {}
+        if op == "lookup_prisoners":
+            numbers = [prisoner_number(self.pick("prisoners")) for _ in range(20)]
+            return "POST", "/prisoners/lookup", {"json": {"id_numbers": numbers}}
+        if op == "prisoners_by_officer":
+            officer = create_objectid(self.officer())
+            return "GET", f"/prisoners/officer/{officer}", {}
+        if op == "update_prisoner":
+            body = {"last_updated_by": str(create_objectid(self.officer()))}
+            return "PUT", f"/prisoners/{self.prisoner()}", {"json": body}
+        if op == "list_officers":
+            return "GET", "/officers/", {}
+        if op == "show_officer":
+            return "GET", f"/officers/{self.officer()}", {}
+        if op == "update_officer":
+            body = {"officer_rank": "Sergeant"}
+            return "PUT", f"/officers/{self.officer()}", {"json": body}
+        if op == "login":
+            body = {"officer_id": self.officer(), "password": "benchmark"}
+            return "POST", "/officers/login", {"json": body}
+        if op == "sync":
+            since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+                minutes=1
+            )
+            return "GET", "/sync/", {"params": {"since": since.isoformat()}}
+        if op == "events":
+            # Only the time to open the stream is measured
+            return "STREAM", "/events/", {"params": {"box_id": self.box()}}
+        if op in ("ml_json", "ml_img"):
+            name, data = self.rng.choice(self.images)
+            url = "/ml/object-to-json" if op == "ml_json" else "/ml/object-to-img"
+            return "POST", url, {"files": {"file": (name, data)}}
+        raise ValueError(f"Unknown operation {op}")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+# Responses counted as errors: server errors, and 429s, which are cheap and
+# would otherwise make a rate-limited operation look fast
+def is_error(status_code):
+    return status_code >= 500 or status_code == 429
+
+
+async def worker(client, workload, weights, deadline, latencies, errors):
+    ops, op_weights = zip(*weights.items())
+    while time.perf_counter() < deadline:
+        op = workload.rng.choices(ops, op_weights)[0]
+        method, url, kwargs = workload.request(op)
+        start = time.perf_counter()
+        try:
+            if method == "STREAM":
+                async with client.stream("GET", url, **kwargs) as response:
+                    failed = is_error(response.status_code)
+            else:
+                response = await client.request(method, url, **kwargs)
+                failed = is_error(response.status_code)
+        except httpx.HTTPError:
+            failed = True
+        latencies[op].append((time.perf_counter() - start) * 1000)
+        if failed:
+            errors[op] += 1
+
+
+async def run(args, weights, counts, images, transport=None):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=args.timeout, transport=transport
+    ) as client:
+        run_id = uuid.uuid4().hex[:3]
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[
+                worker(
+                    client,
+                    Workload(counts, images, random.Random(args.seed + i), run_id, i),
+                    weights,
+                    deadline,
+                    latencies,
+                    errors,
+                )
+                for i in range(args.concurrency)
+            ]
+        )
+        elapsed = time.perf_counter() - started
+
+    results = {}
+    for op, values in sorted(latencies.items()):
+        values.sort()
+        results[op] = {
+            "count": len(values),
+            "errors": errors[op],
+            "throughput": len(values) / elapsed,
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+        }
+    total = sum(r["count"] for r in results.values())
+    return {
+        "mix": args.mix,
+        "concurrency": args.concurrency,
+        "duration": elapsed,
+        "throughput": total / elapsed,
+        "operations": results,
+    }
+
+
+def print_report(report):
+    print(
+        f"mix={report['mix']} concurrency={report['concurrency']} "
+        f"duration={report['duration']:.1f}s throughput={report['throughput']:.1f} req/s"
+    )
+    print(
+        f"{'operation':<22} {'count':>8} {'err':>5} {'req/s':>9} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for op, r in report["operations"].items():
+        print(
+            f"{op:<22} {r['count']:>8} {r['errors']:>5} {r['throughput']:>9.1f} "
+            f"{r['p50']:>9.2f} {r['p95']:>9.2f} {r['p99']:>9.2f}"
+        )
+
+
+# Compare against a baseline run. Returns a list of regression descriptions.
+def compare(report, baseline, tolerance):
+    regressions = []
+    for op, current in report["operations"].items():
+        previous = baseline["operations"].get(op)
+        if previous is None:
+            continue
+        for key in ("p95", "p99"):
+            if previous[key] and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(
+                    f"{op}: {key} {previous[key]:.2f} -> {current[key]:.2f} ms"
+                )
+        if current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{op}: throughput {previous['throughput']:.1f} -> "
+                f"{current['throughput']:.1f} req/s"
+            )
+        if current["errors"] > previous["errors"]:
+            regressions.append(
+                f"{op}: errors {previous['errors']} -> {current['errors']}"
+            )
+    return regressions
+
+
+def load_images(directory):
+    if directory is None:
+        return []
+    return [
+        (path.name, path.read_bytes())
+        for path in sorted(Path(directory).iterdir())
+        if path.suffix.lower() in IMAGE_SUFFIXES
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="read-heavy")
+    parser.add_argument(
+        "--weights",
+        help="override the mix, e.g. show_bag=5,create_bag=1",
+    )
+    parser.add_argument("--concurrency", type=int, default=16, choices=range(1, 101))
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--images", help="directory of sample images for ML mixes")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="compare against a stored report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--save-baseline", help="store this run as a baseline")
+    args = parser.parse_args()
+
+    if not MANIFEST.exists():
+        sys.exit(f"{MANIFEST} not found, run `python -m bench.seed` first")
+    counts = json.loads(MANIFEST.read_text())
+
+    weights = MIXES[args.mix]
+    if args.weights:
+        weights = {
+            op: float(weight)
+            for op, weight in (item.split("=") for item in args.weights.split(","))
+        }
+        args.mix = "custom"
+
+    images = load_images(args.images)
+    if any(op.startswith("ml_") for op in weights) and not images:
+        sys.exit("ML operations need --images with at least one image")
+
+    report = asyncio.run(run(args, weights, counts, images))
+    print_report(report)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Micro-benchmark of bulk model construction from database documents.
+
+    python -m bench.models [--count N]
+
+Documents without `date_registered` / `last_updated` make `BagModel` call its
+`hk_time_now` default factories, so the timestamp helper is on this path.
+Also compares the Pydantic models with the compact read-path records in
+objects/second, bytes/object and list response serialization.
+"""
+import argparse
+import datetime
+import time
+import tracemalloc
+
+import pytz
+from bson import ObjectId
+from pydantic import Field, create_model
+
+from schemas.bag import BagModel, BagCollection, BagRecord
+from util.compact import RecordsResponse
+from util.hk_time_now import hk_time_now
+
+
+# The previous implementation, which looked the timezone up on every call
+def legacy_hk_time_now():
+    hong_kong_tz = pytz.timezone("Asia/Hong_Kong")
+    return datetime.datetime.now(tz=hong_kong_tz)
+
+
+LegacyBagModel = create_model(
+    "LegacyBagModel",
+    __base__=BagModel,
+    date_registered=(datetime.datetime, Field(default_factory=legacy_hk_time_now)),
+    last_updated=(datetime.datetime, Field(default_factory=legacy_hk_time_now)),
+)
+
+
+def bag_documents(count):
+    return [
+        {
+            "_id": ObjectId(),
+            "rfid_epc": f"{i:08d}",
+            "box_id": ObjectId(),
+            "items": ["2 pens", "1 notebook"],
+            "officer_id": "johndoe",
+            "prisoner_id": ObjectId(),
+            "last_updated_by": "johndoe",
+        }
+        for i in range(count)
+    ]
+
+
+def rate(fn, count):
+    start = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - start)
+
+
+def bytes_per_object(fn, count):
+    tracemalloc.start()
+    objects = fn()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+
+# What a list endpoint did before: build models, then let FastAPI validate
+# the response model again and serialize it
+def pydantic_response(docs):
+    collection = BagCollection(bags=[BagModel(**doc) for doc in docs])
+    return BagCollection.model_validate(collection).model_dump_json().encode()
+
+
+def records_response(docs):
+    return RecordsResponse({"bags": [BagRecord.from_doc(doc) for doc in docs]}).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    docs = bag_documents(args.count)
+    results = {
+        "legacy hk_time_now": rate(
+            lambda: [legacy_hk_time_now() for _ in range(args.count)], args.count
+        ),
+        "hk_time_now": rate(
+            lambda: [hk_time_now() for _ in range(args.count)], args.count
+        ),
+        "legacy BagModel": rate(
+            lambda: [LegacyBagModel(**doc) for doc in docs], args.count
+        ),
+        "BagModel": rate(lambda: [BagModel(**doc) for doc in docs], args.count),
+        "BagRecord": rate(
+            lambda: [BagRecord.from_doc(doc) for doc in docs], args.count
+        ),
+        "BagModel response": rate(lambda: pydantic_response(docs), args.count),
+        "BagRecord response": rate(lambda: records_response(docs), args.count),
+    }
+    for name, per_second in results.items():
+        print(f"{name:<20} {per_second:>12,.0f} /s")
+
+    model_bytes = bytes_per_object(lambda: [BagModel(**doc) for doc in docs], args.count)
+    record_bytes = bytes_per_object(
+        lambda: [BagRecord.from_doc(doc) for doc in docs], args.count
+    )
+    print(f"{'BagModel':<20} {model_bytes:>12,.0f} bytes/object")
+    print(f"{'BagRecord':<20} {record_bytes:>12,.0f} bytes/object")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare encode time and output size of the /ml/object-to-img rendering stage
+against the previous `results.render()` + `Image.fromarray(...).save()` path.
+
+    python -m bench.render [IMAGE ...]
+
+Without arguments a synthetic 1024x768 image is used.
+"""
+import argparse
+import io
+import random
+import time
+
+import numpy as np
+from PIL import Image
+
+from ml.render import draw_detections, render_detections
+from ml.segmentation import get_image_from_bytes
+
+
+def synthetic_image(width=1024, height=768):
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)
+    pixels = np.tile(gradient, (height, 1))
+    noise = rng.integers(0, 32, (height, width), dtype=np.uint8)
+    rgb = np.stack([pixels, pixels[::-1] // 2, noise * 4], axis=-1)
+    return Image.fromarray(rgb.astype(np.uint8), "RGB")
+
+
+def synthetic_detections(image, count=8):
+    random.seed(0)
+    width, height = image.size
+    detections = []
+    for i in range(count):
+        x, y = random.randint(0, width - 200), random.randint(0, height - 200)
+        detections.append(
+            {
+                "xmin": x,
+                "ymin": y,
+                "xmax": x + random.randint(50, 200),
+                "ymax": y + random.randint(50, 200),
+                "confidence": random.random(),
+                "class": i,
+                "name": f"item{i}",
+            }
+        )
+    return detections
+
+
+# The previous path: numpy image annotated in place, then re-encoded via fromarray
+def legacy_render(image, detections):
+    imgs = [np.array(image)]
+    for img in imgs:
+        annotated = draw_detections(Image.fromarray(img), detections)
+        imgs[0] = np.asarray(annotated)
+    for img in imgs:
+        bytes_io = io.BytesIO()
+        Image.fromarray(img).save(bytes_io, format="jpeg")
+    return bytes_io.getvalue()
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - start) / repeat * 1000, len(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.images:
+        images = [get_image_from_bytes(open(p, "rb").read()) for p in args.images]
+    else:
+        images = [synthetic_image()]
+
+    variants = {
+        "legacy jpeg": lambda img, det: legacy_render(img, det),
+        "jpeg q75": lambda img, det: render_detections(img, det, "jpeg", 75),
+        "jpeg q60": lambda img, det: render_detections(img, det, "jpeg", 60),
+        "webp q75": lambda img, det: render_detections(img, det, "webp", 75),
+        "jpeg thumb 320": lambda img, det: render_detections(img, det, "jpeg", 75, thumbnail=320),
+        "webp overlay": lambda img, det: render_detections(img, det, "webp", 75, overlay_only=True),
+    }
+
+    print(f"{'variant':<16} {'ms/img':>8} {'bytes':>10}")
+    for name, fn in variants.items():
+        total_ms, total_bytes = 0.0, 0
+        for image in images:
+            detections = synthetic_detections(image)
+            ms, size = timed(lambda: fn(image, detections), args.repeat)
+            total_ms += ms
+            total_bytes += size
+        print(f"{name:<16} {total_ms / len(images):>8.2f} {total_bytes // len(images):>10}")
+
+
+if __name__ == "__main__":
+    main()
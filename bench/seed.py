@@ -0,0 +1,192 @@
+"""
+Seed a MongoDB database with realistic volumes for load testing.
+
+    python -m bench.seed [--bags 1000000] [--drop]
+
+Ids are derived deterministically from each document's index, so the load
+generator can address seeded documents without reading them back. The counts
+used are written to bench/seed.json for `bench.load`.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import time
+from pathlib import Path
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from util.create_objectid import create_objectid
+
+MANIFEST = Path(__file__).with_name("seed.json")
+BATCH_SIZE = 10_000
+
+ITEMS = ["2 pens", "1 notebook", "wallet", "watch", "phone", "keys", "belt", "ring"]
+RANKS = ["Officer", "Sergeant", "Lieutenant", "Captain"]
+
+
+def shelf_id(i):
+    return ObjectId(f"5e{i:022x}")
+
+
+def box_id(i):
+    return ObjectId(f"5b{i:022x}")
+
+
+def officer_code(i):
+    return f"off{i:06d}"
+
+
+def prisoner_number(i):
+    return f"P{i:09d}"
+
+
+def bag_epc(i):
+    return f"{i:012d}"
+
+
+def insert_batched(collection, docs, total):
+    batch = []
+    inserted = 0
+    start = time.perf_counter()
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+            print(f"\r{collection.name}: {inserted:,}/{total:,}", end="", flush=True)
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    elapsed = time.perf_counter() - start
+    print(f"\r{collection.name}: {inserted:,} in {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shelves", type=int, default=100)
+    parser.add_argument("--boxes", type=int, default=5_000)
+    parser.add_argument("--bags", type=int, default=1_000_000)
+    parser.add_argument("--prisoners", type=int, default=50_000)
+    parser.add_argument("--officers", type=int, default=200)
+    parser.add_argument("--database", default="test_db")
+    parser.add_argument("--drop", action="store_true", help="drop collections first")
+    args = parser.parse_args()
+
+    load_dotenv(Path(".env"))
+    db = MongoClient(os.getenv("MONGODB_URI"))[args.database]
+    rng = random.Random(0)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    if args.drop:
+        for name in ("shelves", "boxes", "bags", "prisoners", "officers", "tombstones"):
+            db.drop_collection(name)
+
+    officers = [create_objectid(officer_code(i)) for i in range(args.officers)]
+    boxes_per_shelf = -(-args.boxes // args.shelves)
+
+    insert_batched(
+        db.shelves,
+        (
+            {
+                "_id": shelf_id(i),
+                "capacity": boxes_per_shelf * 2,
+                "shelf_name": f"Shelf {i}",
+                "last_updated": now,
+                "last_updated_by": str(rng.choice(officers)),
+            }
+            for i in range(args.shelves)
+        ),
+        args.shelves,
+    )
+    insert_batched(
+        db.boxes,
+        (
+            {
+                "_id": box_id(i),
+                "last_date_accessed": None,
+                "shelf_id": str(shelf_id(i // boxes_per_shelf)),
+                "last_updated": now,
+                "last_updated_by": str(rng.choice(officers)),
+            }
+            for i in range(args.boxes)
+        ),
+        args.boxes,
+    )
+    insert_batched(
+        db.officers,
+        (
+            {
+                "_id": officers[i],
+                "officer_id": officer_code(i),
+                "password": "benchmark",
+                "first_name": "Officer",
+                "last_name": str(i),
+                "officer_rank": rng.choice(RANKS),
+            }
+            for i in range(args.officers)
+        ),
+        args.officers,
+    )
+    insert_batched(
+        db.prisoners,
+        (
+            {
+                "_id": create_objectid(prisoner_number(i)),
+                "id_number": prisoner_number(i),
+                "first_name": "Prisoner",
+                "last_name": str(i),
+                "gender": rng.choice(["Male", "Female"]),
+                "last_updated": now,
+                "last_updated_by": str(rng.choice(officers)),
+                "officer_id": str(rng.choice(officers)),
+                "discharged": False,
+                "date_discharged": None,
+            }
+            for i in range(args.prisoners)
+        ),
+        args.prisoners,
+    )
+
+    def bags():
+        for i in range(args.bags):
+            registered = now - datetime.timedelta(minutes=rng.randrange(525_600))
+            officer = officer_code(rng.randrange(args.officers))
+            yield {
+                "_id": create_objectid(bag_epc(i)),
+                "rfid_epc": bag_epc(i),
+                "box_id": str(box_id(rng.randrange(args.boxes))),
+                "date_registered": registered,
+                "items": rng.sample(ITEMS, rng.randint(1, 4)),
+                "officer_id": officer,
+                "prisoner_id": str(
+                    create_objectid(prisoner_number(rng.randrange(args.prisoners)))
+                ),
+                "last_updated": registered,
+                "last_updated_by": officer,
+            }
+
+    insert_batched(db.bags, bags(), args.bags)
+
+    MANIFEST.write_text(
+        json.dumps(
+            {
+                "shelves": args.shelves,
+                "boxes": args.boxes,
+                "bags": args.bags,
+                "prisoners": args.prisoners,
+                "officers": args.officers,
+            },
+            indent=2,
+        )
+        + "\n"
+    )
+    print(f"Wrote {MANIFEST}")
+
+
+if __name__ == "__main__":
+    main()
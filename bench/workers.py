@@ -0,0 +1,151 @@
+"""
+Throughput and memory of the gunicorn deployment at different worker counts,
+against a database seeded by `bench.seed`.
+
+    python -m bench.workers [--workers 1 2 4 8] [--mix read-heavy] \
+        [--concurrency 64] [--duration 30]
+
+For each worker count the server is started with gunicorn.conf.py, loaded
+with a `bench.load` mix, then stopped with SIGTERM. Memory is read from
+/proc after the load (Linux only). RSS counts pages shared with the
+preloading master in every worker. PSS splits shared pages between the
+processes using them, so the PSS total is the real footprint.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from bench.load import MANIFEST, MIXES, run
+
+
+# Rss/Pss/Shared of a process in KiB, from /proc/<pid>/smaps_rollup
+def memory(pid):
+    values = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        key, value = line.split(":", 1)
+        values[key] = int(value.split()[0])
+    return {
+        "rss": values["Rss"],
+        "pss": values["Pss"],
+        "shared": values["Shared_Clean"] + values["Shared_Dirty"],
+    }
+
+
+def children(pid):
+    result = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces, fields after it are fixed
+        if int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+            result.append(int(entry.name))
+    return result
+
+
+def wait_ready(url, process, workers, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"gunicorn exited with status {process.returncode}")
+        try:
+            httpx.get(f"{url}/openapi.json", timeout=1).raise_for_status()
+            if len(children(process.pid)) >= workers:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    sys.exit("gunicorn did not become ready")
+
+
+def measure(args, workers, counts):
+    port = args.port
+    url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{port}"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", args.app],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    try:
+        wait_ready(url, process, workers)
+        load_args = argparse.Namespace(
+            url=url,
+            mix=args.mix,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            timeout=30,
+            seed=0,
+        )
+        report = asyncio.run(run(load_args, MIXES[args.mix], counts, []))
+        master = memory(process.pid)
+        worker_memory = [memory(pid) for pid in children(process.pid)]
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+
+    return {
+        "workers": workers,
+        "throughput": report["throughput"],
+        "errors": sum(op["errors"] for op in report["operations"].values()),
+        "master_rss": master["rss"],
+        "worker_rss": sum(m["rss"] for m in worker_memory) / len(worker_memory),
+        "worker_shared": sum(m["shared"] for m in worker_memory) / len(worker_memory),
+        "total_pss": master["pss"] + sum(m["pss"] for m in worker_memory),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="read-heavy")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--app", default="app:app")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show gunicorn logs")
+    args = parser.parse_args()
+
+    if not MANIFEST.exists():
+        sys.exit(f"{MANIFEST} not found, run `python -m bench.seed` first")
+    counts = json.loads(MANIFEST.read_text())
+
+    print(f"{os.cpu_count()} cores, mix={args.mix} concurrency={args.concurrency}")
+    print(
+        f"{'workers':>7} {'req/s':>9} {'scaling':>8} {'errors':>7} "
+        f"{'master RSS':>11} {'worker RSS':>11} {'shared':>9} {'total PSS':>10}"
+    )
+    results = []
+    for workers in args.workers:
+        result = measure(args, workers, counts)
+        results.append(result)
+        scaling = result["throughput"] / results[0]["throughput"]
+        print(
+            f"{workers:>7} {result['throughput']:>9.1f} {scaling:>7.2f}x "
+            f"{result['errors']:>7} {result['master_rss'] / 1024:>8.1f} MiB "
+            f"{result['worker_rss'] / 1024:>7.1f} MiB "
+            f"{result['worker_shared'] / 1024:>5.1f} MiB "
+            f"{result['total_pss'] / 1024:>6.1f} MiB"
+        )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Production entry point: `gunicorn -c gunicorn.conf.py app:app` (`just serve`)
+#
+# The app is imported once in the master process and the workers are forked
+# from it. Everything built at import time (schemas, compiled validators,
+# the ML model once routes/ml.py loads it) is then shared copy-on-write
+# instead of being loaded again per worker. The Motor client is created with
+# `connect=False`, so no connection or monitor thread exists before the fork
+# and each worker opens its own pool on first use.
+import gc
+import os
+import sys
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+worker_class = "util.worker.Worker"
+preload_app = True
+
+# Seconds a worker may go without a heartbeat before it is restarted, and
+# that workers get to finish requests and run shutdown handlers on SIGTERM
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Split the MongoDB connection budget between workers, since each one has its
+# own pool. MONGODB_MAX_POOL_SIZE set explicitly applies to every worker.
+os.environ.setdefault(
+    "MONGODB_MAX_POOL_SIZE",
+    str(max(10, int(os.getenv("MONGODB_POOL_BUDGET", "200")) // workers)),
+)
+
+accesslog = os.getenv("ACCESS_LOG")
+errorlog = "-"
+
+
+def when_ready(server):
+    # The app has been imported. Move everything allocated so far out of the
+    # collector's reach, so garbage collection in the workers does not touch
+    # (and copy) the shared pages.
+    gc.freeze()
+    server.log.info(
+        "Preloaded app, %d objects frozen, starting %d workers",
+        gc.get_freeze_count(),
+        workers,
+    )
+
+
+def post_fork(server, worker):
+    # Without this every worker would start one inference thread per core
+    torch = sys.modules.get("torch")
+    if torch is not None and hasattr(torch, "set_num_threads"):
+        torch.set_num_threads(
+            int(os.getenv("TORCH_THREADS", max(1, (os.cpu_count() or 1) // workers)))
+        )
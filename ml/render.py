@@ -0,0 +1,121 @@
+import io
+
+from PIL import Image, ImageDraw
+
+
+# Output formats supported by the rendering stage and their media types
+MEDIA_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+# Formats that can carry an alpha channel (needed for overlay-only output)
+ALPHA_FORMATS = {"webp", "png"}
+
+# Box colours, cycled through by class index
+PALETTE = [
+    (255, 56, 56),
+    (255, 157, 151),
+    (255, 112, 31),
+    (255, 178, 29),
+    (207, 210, 49),
+    (72, 249, 10),
+    (26, 147, 52),
+    (0, 212, 187),
+    (44, 153, 168),
+    (0, 194, 255),
+]
+
+# libwebp effort level: 0 is fastest, 6 is smallest. The default (4) is
+# several times slower to encode than JPEG at the same quality.
+WEBP_METHOD = 1
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+# Draw detections onto an image (or a transparent overlay of the same size).
+# `detections` are records shaped like `results.pandas().xyxy[0]` rows:
+# xmin, ymin, xmax, ymax, confidence, class, name.
+def draw_detections(image, detections, overlay_only=False, line_width=2):
+    if overlay_only:
+        canvas = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    else:
+        canvas = image.copy()
+    draw = ImageDraw.Draw(canvas)
+
+    for det in detections:
+        colour = PALETTE[int(det.get("class", 0)) % len(PALETTE)]
+        box = (det["xmin"], det["ymin"], det["xmax"], det["ymax"])
+        draw.rectangle(box, outline=colour, width=line_width)
+
+        label = f"{det.get('name', '')} {det.get('confidence', 0):.2f}".strip()
+        left, top, right, bottom = draw.textbbox((0, 0), label)
+        text_w, text_h = right - left, bottom - top
+        text_y = max(det["ymin"] - text_h - 2, 0)
+        draw.rectangle(
+            (det["xmin"], text_y, det["xmin"] + text_w + 4, text_y + text_h + 2),
+            fill=colour,
+        )
+        draw.text((det["xmin"] + 2, text_y), label, fill=(255, 255, 255))
+
+    return canvas
+
+
+# Encode an image exactly once into the requested format
+def encode_image(image, fmt="jpeg", quality=75):
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported image format: {fmt}")
+
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        image.save(buffer, format="JPEG", quality=quality)
+    elif fmt == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=WEBP_METHOD)
+    else:
+        image.save(buffer, format="PNG")
+    return buffer.getbuffer()
+
+
+# Scale detection coordinates by a resize factor
+def scale_detections(detections, factor):
+    keys = ("xmin", "ymin", "xmax", "ymax")
+    return [{**det, **{k: det[k] * factor for k in keys}} for det in detections]
+
+
+# Render detections and encode the result, optionally as a thumbnail.
+# Thumbnails are shrunk before drawing so the boxes are drawn (and the
+# pixels encoded) at the output size only.
+def render_detections(
+    image,
+    detections,
+    fmt="jpeg",
+    quality=75,
+    thumbnail=None,
+    overlay_only=False,
+):
+    if overlay_only and fmt not in ALPHA_FORMATS:
+        raise ValueError(
+            f"Overlay output needs an alpha channel, use one of {sorted(ALPHA_FORMATS)}"
+        )
+
+    if thumbnail and max(image.size) > thumbnail:
+        factor = thumbnail / max(image.size)
+        image = image.resize(
+            (max(int(image.width * factor), 1), max(int(image.height * factor), 1)),
+            reducing_gap=2.0,
+        )
+        detections = scale_detections(detections, factor)
+
+    canvas = draw_detections(image, detections, overlay_only=overlay_only)
+    return encode_image(canvas, fmt=fmt, quality=quality)
+
+
+# Yield encoded bytes in fixed-size chunks for a StreamingResponse
+def iter_chunks(data, chunk_size=STREAM_CHUNK_SIZE):
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start : start + chunk_size])
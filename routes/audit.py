@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Query
+from app import audit_writer
+from schemas.audit import AuditCollection, AuditEntryRecord
+from util.compact import RecordsResponse
+
+audit_router = APIRouter(
+    prefix="/audit",
+    tags=["Audit"],
+)
+
+
+@audit_router.get(
+    "/{entity_id}",
+    response_description="Get the audit log of a document",
+    response_model=AuditCollection,
+    response_model_by_alias=False,
+)
+async def get_audit_log(
+    entity_id: str,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    limit: int = Query(100, gt=0, le=1000),
+):
+    """
+    Get audit log entries for a bag, box or prisoner id, newest first.
+
+    `start` and `end` bound the entry time (timestamps without a timezone are
+    taken as UTC). To page back through a long history, pass the `ts` of the
+    oldest entry received as the next `end`.
+    """
+    query = {"entity.id": entity_id}
+    ts = {}
+    if start is not None:
+        ts["$gte"] = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    if end is not None:
+        ts["$lt"] = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    if ts:
+        query["ts"] = ts
+
+    entries = audit_writer.collection.find(query).sort("ts", -1).limit(limit)
+    return RecordsResponse(
+        {"entries": [AuditEntryRecord.from_doc(entry) async for entry in entries]}
+    )
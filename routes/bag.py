@@ -1,19 +1,51 @@
 from typing import Optional, List
-from fastapi import APIRouter, Body, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
 from fastapi.responses import Response
 from pydantic import BaseModel, Field
 from bson import ObjectId
 from pymongo import ReturnDocument
-from util.create_objectid import create_objectid
+from util.create_objectid import create_objectid, create_objectids
 from util.py_objectid import PyObjectId
-from app import bag_collection
-from schemas.bag import BagModel, BagCollection
+from util.hk_time_now import server_timestamp
+from util.tombstone import insert_tombstones, tombstone
+from util.rate_limit import RateLimit
+from util.audit import audit_entry
+from util.versioning import VersionCheck, version_etag
+from app import (
+    bag_collection,
+    tombstone_collection,
+    rate_limit_backend,
+    audit_writer,
+    list_bags_rate,
+    list_bags_burst,
+)
+from schemas.bag import (
+    BagModel,
+    BagCollection,
+    BagLookupModel,
+    BagLookupResult,
+    BagRecord,
+)
+from util.compact import RecordsResponse
+from util.etag import collection_etag, etag_matches
 
 bag_router = APIRouter(
     prefix="/bags",
     tags=["Bags"],
 )
 
+# Listing reads and serializes up to 1000 bags, keep it from starving intake.
+# Revalidations answered with 304 are cheap and are not charged a token.
+list_bags_limit = RateLimit(
+    "list_bags",
+    rate_limit_backend,
+    rate=list_bags_rate,
+    burst=list_bags_burst,
+    max_concurrent=4,
+    queue_timeout=2,
+    charge=False,
+)
+
 
 @bag_router.post(
     "/",
@@ -23,11 +55,19 @@ bag_router = APIRouter(
     response_model_by_alias=False,
 )
 async def create_bag(bag: BagModel = Body(...)):
-    bag_epc = bag.rfid_epc
+    try:
+        bag_id = create_objectid(bag.rfid_epc)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     new_bag = await bag_collection.insert_one(
-        {**bag.model_dump(by_alias=True), "_id": create_objectid(bag_epc)}
+        {**bag.model_dump(by_alias=True), "_id": bag_id}
+    )
+    # Stamped by the MongoDB clock, the client's `last_updated` is not kept
+    created_bag = await bag_collection.find_one_and_update(
+        {"_id": new_bag.inserted_id},
+        server_timestamp("last_updated"),
+        return_document=ReturnDocument.AFTER,
     )
-    created_bag = await bag_collection.find_one({"_id": new_bag.inserted_id})
     return created_bag
 
 
@@ -36,10 +76,19 @@ async def create_bag(bag: BagModel = Body(...)):
     response_description="List all bags",
     response_model=BagCollection,
     response_model_by_alias=False,
+    dependencies=[Depends(list_bags_limit)],
 )
-async def list_bags():
-    return BagCollection(
-        bags=[BagModel(**bag) for bag in await bag_collection.find().to_list(1000)]
+async def list_bags(request: Request):
+    etag = await collection_etag(bag_collection, tombstone_collection)
+    if etag_matches(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    await list_bags_limit.charge(request)
+    bags = await bag_collection.find().to_list(1000)
+    return RecordsResponse(
+        {"bags": [BagRecord.from_doc(bag) for bag in bags]}, headers={"ETag": etag}
     )
 
 
@@ -49,8 +98,9 @@ async def list_bags():
     response_model=BagModel,
     response_model_by_alias=False,
 )
-async def show_bag(id: str):
+async def show_bag(id: str, response: Response):
     if (bag := await bag_collection.find_one({"_id": ObjectId(id)})) is not None:
+        response.headers["ETag"] = version_etag(bag.get("version", 0))
         return BagModel(**bag)
 
     raise HTTPException(status_code=404, detail=f"Bag {id} not found")
@@ -62,16 +112,33 @@ async def show_bag(id: str):
     response_model=BagModel,
     response_model_by_alias=False,
 )
-async def update_bag(id: str, bag: BagModel = Body(...)):
+async def update_bag(
+    id: str, request: Request, response: Response, bag: BagModel = Body(...)
+):
+    check = VersionCheck(
+        request, bag.version if "version" in bag.model_fields_set else None
+    )
+    query = {"_id": ObjectId(id)}
+    bag_data = bag.model_dump(
+        by_alias=True, exclude={"id", "last_updated", "version"}
+    )
     update_result = await bag_collection.find_one_and_update(
-        {"_id": ObjectId(id)},
-        {"$set": bag.model_dump(by_alias=True)},
+        {**query, **check.filter()},
+        {
+            "$set": bag_data,
+            "$inc": {"version": 1},
+            **server_timestamp("last_updated"),
+        },
         return_document=ReturnDocument.AFTER,
     )
-    if update_result is not None:
-        return BagModel(**update_result)
-    else:
-        raise HTTPException(status_code=404, detail=f"Bag {id} not found")
+    if update_result is None:
+        raise await check.failure(bag_collection, query, "Bag", id)
+
+    await audit_writer.record(
+        audit_entry("bags", id, "update", bag.last_updated_by, bag_data)
+    )
+    response.headers["ETag"] = version_etag(update_result["version"])
+    return BagModel(**update_result)
 
 
 @bag_router.delete(
@@ -80,9 +147,15 @@ async def update_bag(id: str, bag: BagModel = Body(...)):
     status_code=status.HTTP_204_NO_CONTENT,
 )
 async def delete_bag(id: str):
-    delete_result = await bag_collection.delete_one({"_id": ObjectId(id)})
+    deleted_bag = await bag_collection.find_one_and_delete(
+        {"_id": ObjectId(id)}, {"date_registered": 1}
+    )
 
-    if delete_result.deleted_count == 1:
+    if deleted_bag is not None:
+        await insert_tombstones(
+            tombstone_collection,
+            [tombstone("bags", id, date_registered=deleted_bag.get("date_registered"))],
+        )
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     raise HTTPException(status_code=404, detail=f"Bag {id} not found")
@@ -95,8 +168,10 @@ async def delete_bag(id: str):
     response_model_by_alias=False,
 )
 async def get_bags_by_box_id(box_id: PyObjectId):
-    bags = [BagModel(**bag) async for bag in bag_collection.find({"box_id": box_id})]
-    return BagCollection(bags=bags)
+    bags = [
+        BagRecord.from_doc(bag) async for bag in bag_collection.find({"box_id": box_id})
+    ]
+    return RecordsResponse({"bags": bags})
 
 
 @bag_router.get(
@@ -107,7 +182,27 @@ async def get_bags_by_box_id(box_id: PyObjectId):
 )
 async def get_bags_by_prisoner_id(prisoner_id: PyObjectId):
     bags = [
-        BagModel(**bag)
+        BagRecord.from_doc(bag)
         async for bag in bag_collection.find({"prisoner_id": prisoner_id})
     ]
-    return BagCollection(bags=bags)
+    return RecordsResponse({"bags": bags})
+
+
+@bag_router.post(
+    "/lookup",
+    response_description="Look up bags by RFID EPC",
+    response_model=BagLookupResult,
+    response_model_by_alias=False,
+)
+async def lookup_bags(lookup: BagLookupModel = Body(...)):
+    ids, invalid = create_objectids(lookup.rfid_epcs)
+    bags = [
+        BagModel(**bag)
+        async for bag in bag_collection.find({"_id": {"$in": list(ids.values())}})
+    ]
+    found = {bag.id for bag in bags}
+    return BagLookupResult(
+        bags=bags,
+        missing=[epc for epc, bag_id in ids.items() if str(bag_id) not in found],
+        invalid=invalid,
+    )
@@ -1,10 +1,30 @@
-from fastapi import APIRouter, Body, HTTPException, status
+from fastapi import APIRouter, Body, HTTPException, Request, status
 from fastapi.responses import Response
 from bson import ObjectId
 from pymongo import ReturnDocument
 from util.py_objectid import PyObjectId
-from app import box_collection
-from schemas.box import BoxCollection, BoxModel, UpdateBoxModel
+from util.hk_time_now import server_timestamp
+from util.tombstone import insert_tombstones, tombstone
+from util.audit import audit_entry
+from util.versioning import VersionCheck, version_etag
+from app import (
+    client,
+    box_collection,
+    shelf_collection,
+    tombstone_collection,
+    audit_writer,
+)
+from schemas.box import (
+    BoxCollection,
+    BoxModel,
+    UpdateBoxModel,
+    MoveBoxesModel,
+    BoxMoveResult,
+    MoveBoxesResult,
+    BoxRecord,
+)
+from util.compact import RecordsResponse
+from util.etag import collection_etag, etag_matches
 
 box_router = APIRouter(
     prefix="/boxes",
@@ -21,7 +41,12 @@ box_router = APIRouter(
 )
 async def create_box(box: BoxModel = Body(...)):
     new_box = await box_collection.insert_one(box.model_dump(by_alias=True, exclude=["id"]))
-    created_box = await box_collection.find_one({"_id": new_box.inserted_id})
+    # Stamped by the MongoDB clock, the client's `last_updated` is not kept
+    created_box = await box_collection.find_one_and_update(
+        {"_id": new_box.inserted_id},
+        server_timestamp("last_updated"),
+        return_document=ReturnDocument.AFTER,
+    )
     return created_box
 
 
@@ -31,8 +56,17 @@ async def create_box(box: BoxModel = Body(...)):
     response_model=list[BoxModel],
     response_model_by_alias=False,
 )
-async def list_boxes():
-    return [BoxModel(**box) for box in await box_collection.find().to_list(1000)]
+async def list_boxes(request: Request):
+    etag = await collection_etag(box_collection, tombstone_collection)
+    if etag_matches(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    boxes = await box_collection.find().to_list(1000)
+    return RecordsResponse(
+        [BoxRecord.from_doc(box) for box in boxes], headers={"ETag": etag}
+    )
 
 
 @box_router.get(
@@ -41,8 +75,9 @@ async def list_boxes():
     response_model=BoxModel,
     response_model_by_alias=False,
 )
-async def show_box(id: str):
+async def show_box(id: str, response: Response):
     if (box := await box_collection.find_one({"_id": ObjectId(id)})) is not None:
+        response.headers["ETag"] = version_etag(box.get("version", 0))
         return BoxModel(**box)
 
     raise HTTPException(status_code=404, detail=f"Box {id} not found")
@@ -54,16 +89,31 @@ async def show_box(id: str):
     response_model=BoxModel,
     response_model_by_alias=False,
 )
-async def update_box(id: str, box: UpdateBoxModel = Body(...)):
+async def update_box(
+    id: str, request: Request, response: Response, box: UpdateBoxModel = Body(...)
+):
+    check = VersionCheck(request, box.version)
+    query = {"_id": ObjectId(id)}
+    box_data = box.model_dump(
+        by_alias=True, exclude_none=True, exclude={"last_updated", "version"}
+    )
     update_result = await box_collection.find_one_and_update(
-        {"_id": ObjectId(id)},
-        {"$set": box.model_dump(by_alias=True, exclude_none=True)},
+        {**query, **check.filter()},
+        {
+            "$set": box_data,
+            "$inc": {"version": 1},
+            **server_timestamp("last_updated"),
+        },
         return_document=ReturnDocument.AFTER,
     )
-    if update_result is not None:
-        return BoxModel(**update_result)
-    else:
-        raise HTTPException(status_code=404, detail=f"Box {id} not found")
+    if update_result is None:
+        raise await check.failure(box_collection, query, "Box", id)
+
+    await audit_writer.record(
+        audit_entry("boxes", id, "update", box.last_updated_by, box_data)
+    )
+    response.headers["ETag"] = version_etag(update_result["version"])
+    return BoxModel(**update_result)
 
 
 @box_router.delete(
@@ -75,6 +125,7 @@ async def delete_box(id: str):
     delete_result = await box_collection.delete_one({"_id": ObjectId(id)})
 
     if delete_result.deleted_count == 1:
+        await insert_tombstones(tombstone_collection, [tombstone("boxes", id)])
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     raise HTTPException(status_code=404, detail=f"Box {id} not found")
@@ -87,7 +138,107 @@ async def delete_box(id: str):
     response_model_by_alias=False,
 )
 async def list_boxes_in_shelf(shelf_id: PyObjectId):
-    return [
-        BoxModel(**box)
-        for box in await box_collection.find({"shelf_id": shelf_id}).to_list(1000)
-    ]
+    boxes = await box_collection.find({"shelf_id": shelf_id}).to_list(1000)
+    return RecordsResponse({"boxes": [BoxRecord.from_doc(box) for box in boxes]})
+
+
+@box_router.post(
+    "/move",
+    response_description="Move boxes to a shelf",
+    response_model=MoveBoxesResult,
+    response_model_by_alias=False,
+)
+async def move_boxes(move: MoveBoxesModel = Body(...)):
+    """
+    Move a batch of boxes onto one shelf in a single transaction.
+
+    The target shelf's `capacity` is checked against the boxes already on it
+    plus the boxes being moved; if it would be exceeded nothing is moved.
+    Every requested id gets an outcome in `results`.
+    """
+    if not ObjectId.is_valid(move.shelf_id):
+        raise HTTPException(status_code=422, detail=f"Invalid shelf id {move.shelf_id}")
+
+    box_ids = list(dict.fromkeys(move.box_ids))
+    object_ids = [ObjectId(box_id) for box_id in box_ids if ObjectId.is_valid(box_id)]
+
+    async def apply_move(session):
+        # Moves only write the boxes, so two moves to the same shelf would not
+        # conflict and could both pass the capacity check. Writing the shelf
+        # first makes them conflict: the transaction that commits second is
+        # retried by `with_transaction` and counts the other's boxes.
+        shelf = await shelf_collection.find_one_and_update(
+            {"_id": ObjectId(move.shelf_id)},
+            {"$inc": {"move_count": 1}},
+            {"capacity": 1},
+            session=session,
+        )
+        if shelf is None:
+            raise HTTPException(status_code=404, detail=f"Shelf {move.shelf_id} not found")
+
+        current_shelves = {
+            str(box["_id"]): box.get("shelf_id")
+            async for box in box_collection.find(
+                {"_id": {"$in": object_ids}}, {"shelf_id": 1}, session=session
+            )
+        }
+        to_move = [
+            ObjectId(box_id)
+            for box_id, shelf_id in current_shelves.items()
+            if shelf_id != move.shelf_id
+        ]
+
+        occupied = await box_collection.count_documents(
+            {"shelf_id": move.shelf_id}, session=session
+        )
+        if occupied + len(to_move) > shelf["capacity"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Shelf {move.shelf_id} has room for {shelf['capacity'] - occupied} "
+                f"more boxes, {len(to_move)} requested",
+            )
+
+        if to_move:
+            await box_collection.update_many(
+                {"_id": {"$in": to_move}},
+                {
+                    "$set": {
+                        "shelf_id": move.shelf_id,
+                        "last_updated_by": move.last_updated_by,
+                    },
+                    "$inc": {"version": 1},
+                    **server_timestamp("last_updated"),
+                },
+                session=session,
+            )
+        return current_shelves, len(to_move)
+
+    async with await client.start_session() as session:
+        current_shelves, moved = await session.with_transaction(apply_move)
+
+    await audit_writer.record_many(
+        audit_entry(
+            "boxes",
+            box_id,
+            "move",
+            move.last_updated_by,
+            {"shelf_id": move.shelf_id},
+            {"shelf_id": shelf_id},
+        )
+        for box_id, shelf_id in current_shelves.items()
+        if shelf_id != move.shelf_id
+    )
+
+    results = []
+    for box_id in box_ids:
+        if not ObjectId.is_valid(box_id):
+            box_status = "invalid_id"
+        elif box_id not in current_shelves:
+            box_status = "not_found"
+        elif current_shelves[box_id] == move.shelf_id:
+            box_status = "unchanged"
+        else:
+            box_status = "moved"
+        results.append(BoxMoveResult(id=box_id, status=box_status))
+
+    return MoveBoxesResult(shelf_id=move.shelf_id, moved=moved, results=results)
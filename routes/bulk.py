@@ -0,0 +1,94 @@
+from tempfile import SpooledTemporaryFile
+from typing import Literal
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+from app import db
+from schemas.bulk import ImportResult
+from util import bulk_io
+from util.bulk_io import BULK_COLLECTIONS, MEDIA_TYPES, import_file, iter_export
+
+# Uploads larger than this are spooled to a temporary file
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Largest upload accepted by an import
+MAX_UPLOAD_SIZE = 512 * 1024 * 1024
+
+bulk_router = APIRouter(
+    prefix="/bulk",
+    tags=["Bulk"],
+)
+
+
+def bulk_schema(collection, fmt):
+    if collection not in BULK_COLLECTIONS:
+        raise HTTPException(
+            status_code=404, detail=f"Collection {collection} cannot be exported"
+        )
+    if fmt == "parquet" and bulk_io.pyarrow is None:
+        raise HTTPException(status_code=501, detail="Parquet support is not installed")
+    return BULK_COLLECTIONS[collection]
+
+
+@bulk_router.get(
+    "/{collection}/export",
+    response_description="Export a whole collection",
+    response_class=StreamingResponse,
+)
+async def export_collection(
+    collection: str, format: Literal["csv", "parquet"] = Query("csv")
+):
+    """
+    Stream every document of `bags`, `boxes`, `prisoners` or `shelves` as
+    CSV or Parquet. The file has one column per schema field.
+    """
+    schema = bulk_schema(collection, format)
+    return StreamingResponse(
+        iter_export(db.get_collection(collection), schema, format),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{collection}.{format}"'
+        },
+    )
+
+
+@bulk_router.post(
+    "/{collection}/import",
+    response_description="Import documents into a collection",
+    response_model=ImportResult,
+)
+async def import_collection(
+    collection: str,
+    request: Request,
+    format: Literal["csv", "parquet"] = Query("csv"),
+    upsert: bool = Query(False),
+):
+    """
+    Import a CSV or Parquet file, sent as the request body, in the format
+    produced by the export.
+
+    Rows are validated against the collection's schema. Invalid rows are
+    skipped and reported. Without `upsert`, documents that already exist
+    are counted as duplicates and left alone. With it, they are replaced.
+    Uploads over `MAX_UPLOAD_SIZE` bytes get 413.
+    """
+    schema = bulk_schema(collection, format)
+    too_large = HTTPException(
+        status_code=413, detail=f"Uploads are limited to {MAX_UPLOAD_SIZE} bytes"
+    )
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_UPLOAD_SIZE:
+        raise too_large
+
+    with SpooledTemporaryFile(max_size=SPOOL_SIZE) as file:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                raise too_large
+            # Past SPOOL_SIZE this writes to disk
+            await run_in_threadpool(file.write, chunk)
+        await run_in_threadpool(file.seek, 0)
+        return await import_file(
+            db.get_collection(collection), schema, file, format, upsert
+        )
@@ -0,0 +1,78 @@
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+from app import change_feed
+
+events_router = APIRouter(
+    prefix="/events",
+    tags=["Events"],
+)
+
+# Seconds between keep-alive comments on an idle stream
+KEEPALIVE_INTERVAL = 15
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+
+
+@events_router.get(
+    "/",
+    response_description="Stream inventory changes as Server-Sent Events",
+)
+async def stream_events(
+    shelf_id: Optional[str] = Query(None),
+    box_id: Optional[str] = Query(None),
+    prisoner_id: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Stream changes to bags, boxes, shelves and prisoners.
+
+    Optionally filter by `shelf_id` (the shelf and its boxes), `box_id`
+    (the box and its bags) or `prisoner_id` (the prisoner and their bags).
+    Updates and deletes carry the document as it was in `previous`, and
+    match a filter on either version, so moves out of a shelf or box and
+    deletions are included.
+
+    Reconnecting clients send the standard `Last-Event-ID` header to resume.
+    If that event is no longer available a `resync` event is sent first and
+    the client should refetch the data it displays.
+    A client that falls too far behind receives a `dropped` event and is
+    disconnected.
+    """
+    filters = {
+        key: value
+        for key, value in (
+            ("shelf_id", shelf_id),
+            ("box_id", box_id),
+            ("prisoner_id", prisoner_id),
+        )
+        if value is not None
+    }
+    subscriber, resumed = change_feed.subscribe(filters, last_event_id)
+
+    async def event_stream():
+        try:
+            if not resumed:
+                yield "event: resync\ndata: {}\n\n"
+            while not subscriber.dropped:
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(), KEEPALIVE_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(event)
+            yield "event: dropped\ndata: {}\n\n"
+        finally:
+            change_feed.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
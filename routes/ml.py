@@ -1,22 +1,36 @@
-
-from fastapi import APIRouter, File
-from starlette.responses import Response
-import io
-from PIL import Image
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
 import json
 
 from ml.segmentation import get_yolov5, get_image_from_bytes
+from ml.render import MEDIA_TYPES, render_detections, iter_chunks
+from util.rate_limit import RateLimit
+from app import rate_limit_backend, ml_rate, ml_burst
+
+# Inference is CPU bound: a few requests per client, two at a time per worker
+ml_limit = RateLimit(
+    "ml",
+    rate_limit_backend,
+    rate=ml_rate,
+    burst=ml_burst,
+    max_concurrent=2,
+    queue_timeout=5,
+    max_queue=8,
+)
 
 ml_router = APIRouter(
     prefix="/ml",
-    tags=["Machine Learning"]
+    tags=["Machine Learning"],
+    dependencies=[Depends(ml_limit)],
 )
 
 # model = get_yolov5()
 
 @ml_router.post("/object-to-json")
 async def detect_hkd_return_json_result(file: bytes = File(...)):
-    input_image = get_image_from_bytes(file)
+    input_image = await run_in_threadpool(get_image_from_bytes, file)
     # results = model(input_image)
     # detect_res = results.pandas().xyxy[0].to_json(orient="records")  # JSON img1 predictions
     # detect_res = json.loads(detect_res)
@@ -24,12 +38,39 @@ async def detect_hkd_return_json_result(file: bytes = File(...)):
 
 
 @ml_router.post("/object-to-img")
-async def detect_hkd_return_base64_img(file: bytes = File(...)):
-    input_image = get_image_from_bytes(file)
+async def detect_hkd_return_base64_img(
+    file: bytes = File(...),
+    format: Literal["jpeg", "webp", "png"] = Query("jpeg"),
+    quality: int = Query(75, ge=1, le=100),
+    thumbnail: Optional[int] = Query(None, gt=0, le=1024),
+    overlay: bool = Query(False),
+):
+    """
+    Detect objects and return the image with the detections drawn on it.
+
+    Detections are drawn on the already-resized input and encoded once.
+    Use `thumbnail` to bound the longest side of the output, and `overlay`
+    to return only the detections on a transparent background (webp/png).
+    """
+    input_image = await run_in_threadpool(get_image_from_bytes, file)
     # results = model(input_image)
-    # results.render()  # updates results.imgs with boxes and labels
-    # for img in results.imgs:
-    #     bytes_io = io.BytesIO()
-    #     img_base64 = Image.fromarray(img)
-    #     img_base64.save(bytes_io, format="jpeg")
-    # return Response(content=bytes_io.getvalue(), media_type="image/jpeg")
+    # detections = results.pandas().xyxy[0].to_dict(orient="records")
+    detections = []
+    try:
+        content = await run_in_threadpool(
+            render_detections,
+            input_image,
+            detections,
+            fmt=format,
+            quality=quality,
+            thumbnail=thumbnail,
+            overlay_only=overlay,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return StreamingResponse(
+        iter_chunks(content),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Length": str(len(content))},
+    )
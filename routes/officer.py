@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Body, HTTPException, status
+from fastapi import APIRouter, Body, HTTPException, Request, status
 from fastapi.responses import Response
 from pymongo import ReturnDocument
 from schemas.officer import (
@@ -7,10 +7,13 @@ from schemas.officer import (
     OfficerCollection,
     SignupModel,
     LoginModel,
+    OfficerRecord,
 )
 from app import officer_collection
 from schemas.prisoner import PrisonerModel
 from util.create_objectid import create_objectid
+from util.compact import RecordsResponse
+from util.versioning import VersionCheck, version_etag
 
 officer_router = APIRouter(
     prefix="/officers",
@@ -26,9 +29,12 @@ officer_router = APIRouter(
     response_model_by_alias=False,
 )
 async def signup_officer(data: SignupModel = Body(...)):
-    officer_id = data.officer_id
+    try:
+        officer_id = create_objectid(data.officer_id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     new_officer = await officer_collection.insert_one(
-        {**data.model_dump(by_alias=True), "_id": create_objectid(officer_id)}
+        {**data.model_dump(by_alias=True), "_id": officer_id}
     )
     created_officer = await officer_collection.find_one(
         {"_id": new_officer.inserted_id}
@@ -59,7 +65,9 @@ async def login_officer(data: LoginModel = Body(...)):
 )
 async def list_officers():
     officers = await officer_collection.find().to_list(1000)
-    return OfficerCollection(officers=[OfficerModel(**officer) for officer in officers])
+    return RecordsResponse(
+        {"officers": [OfficerRecord.from_doc(officer) for officer in officers]}
+    )
 
 
 @officer_router.get(
@@ -68,8 +76,9 @@ async def list_officers():
     response_model=OfficerModel,
     response_model_by_alias=False,
 )
-async def show_officer(id: str):
+async def show_officer(id: str, response: Response):
     if (officer := await officer_collection.find_one({"officer_id": id})) is not None:
+        response.headers["ETag"] = version_etag(officer.get("version", 0))
         return OfficerModel(**officer)
 
     raise HTTPException(status_code=404, detail=f"Officer {id} not found")
@@ -81,16 +90,29 @@ async def show_officer(id: str):
     response_model=OfficerModel,
     response_model_by_alias=False,
 )
-async def update_officer(id: str, officer: UpdateOfficerModel = Body(...)):
+async def update_officer(
+    id: str,
+    request: Request,
+    response: Response,
+    officer: UpdateOfficerModel = Body(...),
+):
+    check = VersionCheck(request, officer.version)
+    query = {"officer_id": id}
     update_result = await officer_collection.find_one_and_update(
-        {"officer_id": id},
-        {"$set": officer.model_dump(by_alias=True, exclude_none=True)},
+        {**query, **check.filter()},
+        {
+            "$set": officer.model_dump(
+                by_alias=True, exclude_none=True, exclude={"version"}
+            ),
+            "$inc": {"version": 1},
+        },
         return_document=ReturnDocument.AFTER,
     )
-    if update_result is not None:
-        return OfficerModel(**update_result)
-    else:
-        raise HTTPException(status_code=404, detail=f"Officer {id} not found")
+    if update_result is None:
+        raise await check.failure(officer_collection, query, "Officer", id)
+
+    response.headers["ETag"] = version_etag(update_result["version"])
+    return OfficerModel(**update_result)
 
 
 @officer_router.delete(
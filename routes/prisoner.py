@@ -1,11 +1,33 @@
-from fastapi import APIRouter, Body, HTTPException, status
+from fastapi import APIRouter, Body, HTTPException, Request, status
 from fastapi.responses import Response
 from bson import ObjectId
 from pymongo import ReturnDocument
-from util.create_objectid import create_objectid
-from schemas.prisoner import PrisonerModel, UpdatePrisonerModel, PrisonerCollection
-from app import prisoner_collection
-from util.hk_time_now import hk_time_now
+from util.create_objectid import create_objectid, create_objectids
+from schemas.prisoner import (
+    PrisonerModel,
+    UpdatePrisonerModel,
+    PrisonerCollection,
+    DischargeModel,
+    DischargeManifest,
+    PrisonerLookupModel,
+    PrisonerLookupResult,
+    PrisonerRecord,
+)
+from schemas.bag import BagModel
+from app import (
+    client,
+    prisoner_collection,
+    bag_collection,
+    box_collection,
+    tombstone_collection,
+    audit_writer,
+)
+from util.audit import audit_entry
+from util.hk_time_now import server_timestamp
+from util.tombstone import insert_tombstones, tombstone
+from util.versioning import VersionCheck, version_etag
+from util.compact import RecordsResponse
+from util.etag import collection_etag, etag_matches
 
 prisoner_router = APIRouter(
     prefix="/prisoners",
@@ -21,12 +43,25 @@ prisoner_router = APIRouter(
     response_model_by_alias=False,
 )
 async def create_prisoner(prisoner: PrisonerModel = Body(...)):
-    govn_id = prisoner.id_number
+    try:
+        prisoner_id = create_objectid(prisoner.id_number)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # Prisoners are only discharged through POST /{id}/discharge, which also
+    # releases their bags
     new_prisoner = await prisoner_collection.insert_one(
-        {**prisoner.model_dump(by_alias=True), "_id": create_objectid(govn_id)}
+        {
+            **prisoner.model_dump(by_alias=True),
+            "_id": prisoner_id,
+            "discharged": False,
+            "date_discharged": None,
+        }
     )
-    created_prisoner = await prisoner_collection.find_one(
-        {"_id": new_prisoner.inserted_id}
+    # Stamped by the MongoDB clock, the client's `last_updated` is not kept
+    created_prisoner = await prisoner_collection.find_one_and_update(
+        {"_id": new_prisoner.inserted_id},
+        server_timestamp("last_updated"),
+        return_document=ReturnDocument.AFTER,
     )
     return created_prisoner
 
@@ -37,12 +72,17 @@ async def create_prisoner(prisoner: PrisonerModel = Body(...)):
     response_model=PrisonerCollection,
     response_model_by_alias=False,
 )
-async def list_prisoners():
-    return PrisonerCollection(
-        prisoners=[
-            PrisonerModel(**prisoner)
-            for prisoner in await prisoner_collection.find().to_list(1000)
-        ]
+async def list_prisoners(request: Request):
+    etag = await collection_etag(prisoner_collection, tombstone_collection)
+    if etag_matches(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    prisoners = await prisoner_collection.find().to_list(1000)
+    return RecordsResponse(
+        {"prisoners": [PrisonerRecord.from_doc(prisoner) for prisoner in prisoners]},
+        headers={"ETag": etag},
     )
 
 
@@ -52,10 +92,11 @@ async def list_prisoners():
     response_model=PrisonerModel,
     response_model_by_alias=False,
 )
-async def show_prisoner(id: str):
+async def show_prisoner(id: str, response: Response):
     if (
         prisoner := await prisoner_collection.find_one({"_id": ObjectId(id)})
     ) is not None:
+        response.headers["ETag"] = version_etag(prisoner.get("version", 0))
         return PrisonerModel(**prisoner)
 
     raise HTTPException(status_code=404, detail=f"Prisoner {id} not found")
@@ -67,18 +108,36 @@ async def show_prisoner(id: str):
     response_model=PrisonerModel,
     response_model_by_alias=False,
 )
-async def update_prisoner(id: str, prisoner: UpdatePrisonerModel = Body(...)):
-    prisoner_data = prisoner.model_dump(by_alias=True, exclude_none=True)
-    prisoner_data["last_updated"] = hk_time_now()
+async def update_prisoner(
+    id: str,
+    request: Request,
+    response: Response,
+    prisoner: UpdatePrisonerModel = Body(...),
+):
+    check = VersionCheck(request, prisoner.version)
+    query = {"_id": ObjectId(id)}
+    prisoner_data = prisoner.model_dump(
+        by_alias=True, exclude_none=True, exclude={"last_updated", "version"}
+    )
     update_result = await prisoner_collection.find_one_and_update(
-        {"_id": ObjectId(id)},
-        {"$set": prisoner_data},
+        {**query, **check.filter()},
+        {
+            "$set": prisoner_data,
+            "$inc": {"version": 1},
+            **server_timestamp("last_updated"),
+        },
         return_document=ReturnDocument.AFTER,
     )
-    if update_result is not None:
-        return PrisonerModel(**update_result)
-    else:
-        raise HTTPException(status_code=404, detail=f"Prisoner {id} not found")
+    if update_result is None:
+        raise await check.failure(prisoner_collection, query, "Prisoner", id)
+
+    await audit_writer.record(
+        audit_entry(
+            "prisoners", id, "update", prisoner.last_updated_by, prisoner_data
+        )
+    )
+    response.headers["ETag"] = version_etag(update_result["version"])
+    return PrisonerModel(**update_result)
 
 
 @prisoner_router.delete(
@@ -90,6 +149,7 @@ async def delete_prisoner(id: str):
     delete_result = await prisoner_collection.delete_one({"_id": ObjectId(id)})
 
     if delete_result.deleted_count == 1:
+        await insert_tombstones(tombstone_collection, [tombstone("prisoners", id)])
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     raise HTTPException(status_code=404, detail=f"Prisoner {id} not found")
@@ -103,6 +163,127 @@ async def delete_prisoner(id: str):
 )
 async def get_prisoners_in_officer(officer_id: str):
     prisoners = await prisoner_collection.find({"officer_id": officer_id}).to_list(1000)
-    return PrisonerCollection(
-        prisoners=[PrisonerModel(**prisoner) for prisoner in prisoners]
+    return RecordsResponse(
+        {"prisoners": [PrisonerRecord.from_doc(prisoner) for prisoner in prisoners]}
+    )
+
+
+@prisoner_router.post(
+    "/{id}/discharge",
+    response_description="Discharge a prisoner and release their bags",
+    response_model=DischargeManifest,
+    response_model_by_alias=False,
+)
+async def discharge_prisoner(id: str, discharge: DischargeModel = Body(...)):
+    """
+    Discharge a prisoner in a single transaction.
+
+    The prisoner is marked as discharged, all of their bags are removed from
+    storage with one batched delete, and the boxes that held them are stamped
+    as accessed. Either all of this happens or none of it does.
+
+    The returned manifest lists every released bag and the boxes they came from.
+    """
+    async def apply_discharge(session):
+        prisoner = await prisoner_collection.find_one_and_update(
+            {"_id": ObjectId(id), "discharged": {"$ne": True}},
+            {
+                "$set": {
+                    "discharged": True,
+                    "last_updated_by": discharge.last_updated_by,
+                },
+                "$inc": {"version": 1},
+                **server_timestamp("date_discharged", "last_updated"),
+            },
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if prisoner is None:
+            if await prisoner_collection.count_documents(
+                {"_id": ObjectId(id)}, limit=1, session=session
+            ):
+                raise HTTPException(
+                    status_code=409, detail=f"Prisoner {id} is already discharged"
+                )
+            raise HTTPException(status_code=404, detail=f"Prisoner {id} not found")
+
+        bags = await bag_collection.find({"prisoner_id": id}, session=session).to_list(
+            None
+        )
+        box_ids = list(dict.fromkeys(bag["box_id"] for bag in bags))
+        box_object_ids = [ObjectId(b) for b in box_ids if ObjectId.is_valid(b)]
+
+        if bags:
+            await bag_collection.delete_many({"prisoner_id": id}, session=session)
+            await insert_tombstones(
+                tombstone_collection,
+                [
+                    tombstone(
+                        "bags", bag["_id"], date_registered=bag.get("date_registered")
+                    )
+                    for bag in bags
+                ],
+                session=session,
+            )
+            await box_collection.update_many(
+                {"_id": {"$in": box_object_ids}},
+                {
+                    "$set": {"last_updated_by": discharge.last_updated_by},
+                    "$inc": {"version": 1},
+                    **server_timestamp("last_date_accessed", "last_updated"),
+                },
+                session=session,
+            )
+        return prisoner, bags, box_ids
+
+    async with await client.start_session() as session:
+        prisoner, bags, box_ids = await session.with_transaction(apply_discharge)
+
+    actor = discharge.last_updated_by
+    await audit_writer.record(
+        audit_entry(
+            "prisoners",
+            id,
+            "discharge",
+            actor,
+            {"discharged": True, "date_discharged": prisoner["date_discharged"]},
+        )
+    )
+    await audit_writer.record_many(
+        audit_entry(
+            "bags", bag["_id"], "discharge", actor, previous={"box_id": bag["box_id"]}
+        )
+        for bag in bags
+    )
+
+    return DischargeManifest(
+        prisoner=PrisonerModel(**prisoner),
+        bags=[BagModel(**bag) for bag in bags],
+        box_ids=box_ids,
+    )
+
+
+@prisoner_router.post(
+    "/lookup",
+    response_description="Look up prisoners by ID number",
+    response_model=PrisonerLookupResult,
+    response_model_by_alias=False,
+)
+async def lookup_prisoners(lookup: PrisonerLookupModel = Body(...)):
+    ids, invalid = create_objectids(lookup.id_numbers)
+    prisoners = [
+        PrisonerModel(**prisoner)
+        async for prisoner in prisoner_collection.find(
+            {"_id": {"$in": list(ids.values())}}
+        )
+    ]
+    found = {prisoner.id for prisoner in prisoners}
+    return PrisonerLookupResult(
+        prisoners=prisoners,
+        missing=[
+            id_number
+            for id_number, prisoner_id in ids.items()
+            if str(prisoner_id) not in found
+        ],
+        invalid=invalid,
     )
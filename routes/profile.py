@@ -0,0 +1,48 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app import profile_token
+from util.profiler import MAX_PROFILE_SECONDS, SAMPLE_INTERVAL, Sampler, token_matches
+
+profile_router = APIRouter(
+    prefix="/profile",
+    tags=["Profiling"],
+)
+
+
+@profile_router.post(
+    "/",
+    response_description="Profile of this worker in collapsed stack format",
+    response_class=PlainTextResponse,
+)
+async def profile_window(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(SAMPLE_INTERVAL * 1000, ge=1, le=1000),
+    x_profile: Optional[str] = Header(None),
+):
+    """
+    Sample every thread of the worker that receives this request for
+    `seconds`, and return the stacks in collapsed format for flamegraph.pl
+    or speedscope. Requires the admin token in `X-Profile`.
+
+    With several workers each profile only covers one of them.
+    """
+    if profile_token is None:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    if x_profile is None or not token_matches(x_profile, profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+    sampler = Sampler(interval_ms / 1000)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    return PlainTextResponse(
+        sampler.folded(),
+        headers={
+            "X-Profile-Duration": f"{sampler.duration:.3f}",
+            "X-Profile-Samples": str(sampler.samples),
+        },
+    )
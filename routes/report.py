@@ -0,0 +1,121 @@
+from datetime import date, datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from app import bag_rollup
+from schemas.report import BagReport, ReportRefreshResult
+
+report_router = APIRouter(
+    prefix="/reports",
+    tags=["Reports"],
+)
+
+
+# Sum the rollup documents of one dimension per key (or per day) within a range
+# of registration days
+async def rollup_report(dimension, start, end, group_by="$key"):
+    days = {}
+    if start is not None:
+        days["$gte"] = start.isoformat()
+    if end is not None:
+        days["$lte"] = end.isoformat()
+    match = {"dimension": dimension}
+    if days:
+        match["day"] = days
+
+    groups = await bag_rollup.collection.aggregate(
+        [
+            {"$match": match},
+            {
+                "$group": {
+                    "_id": group_by,
+                    "count": {"$sum": "$count"},
+                    "registered_ms": {"$sum": "$registered_ms"},
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ]
+    ).to_list(None)
+    state = await bag_rollup.status()
+
+    now_ms = datetime.now(timezone.utc).timestamp() * 1000
+    return BagReport(
+        refreshed_at=state.get("watermark"),
+        rows=[
+            {
+                "key": group["_id"],
+                "count": group["count"],
+                "average_storage_hours": (
+                    now_ms - group["registered_ms"] / group["count"]
+                )
+                / 3_600_000,
+            }
+            for group in groups
+        ],
+    )
+
+
+@report_router.get(
+    "/officers",
+    response_description="Bags registered per officer",
+    response_model=BagReport,
+)
+async def report_officers(
+    start: Optional[date] = Query(None), end: Optional[date] = Query(None)
+):
+    """
+    Bags in storage per registering officer, for bags registered between
+    `start` and `end` (inclusive, Hong Kong dates).
+    """
+    return await rollup_report("officer", start, end)
+
+
+@report_router.get(
+    "/boxes",
+    response_description="Bags stored per box",
+    response_model=BagReport,
+)
+async def report_boxes(
+    start: Optional[date] = Query(None), end: Optional[date] = Query(None)
+):
+    """
+    Bags in storage per box, for bags registered between `start` and `end`
+    (inclusive, Hong Kong dates).
+    """
+    return await rollup_report("box", start, end)
+
+
+@report_router.get(
+    "/days",
+    response_description="Bags registered per day",
+    response_model=BagReport,
+)
+async def report_days(
+    start: Optional[date] = Query(None), end: Optional[date] = Query(None)
+):
+    """
+    Bags in storage per registration day between `start` and `end`
+    (inclusive, Hong Kong dates).
+    """
+    return await rollup_report("all", start, end, group_by="$day")
+
+
+@report_router.post(
+    "/refresh",
+    response_description="Refresh the report rollups",
+    response_model=ReportRefreshResult,
+)
+async def refresh_reports(full: bool = Query(False)):
+    """
+    Bring the rollups up to date now instead of waiting for the background
+    job. `full` rebuilds them from scratch.
+    """
+    state = await bag_rollup.refresh(full=full)
+    if state is None:
+        raise HTTPException(
+            status_code=409,
+            detail="Reports are being refreshed by another worker",
+            headers={"Retry-After": "5"},
+        )
+    return ReportRefreshResult(
+        refreshed_at=state["watermark"], last_full_rebuild=state["last_full"]
+    )
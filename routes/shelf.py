@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Body, HTTPException, status
+from fastapi import APIRouter, Body, HTTPException, Request, status
 from fastapi.responses import Response
 from bson import ObjectId
 from pymongo import ReturnDocument
-from schemas.shelf import ShelfModel, UpdateShelfModel, ShelfCollection
-from app import shelf_collection
+from schemas.shelf import ShelfModel, UpdateShelfModel, ShelfCollection, ShelfRecord
+from app import shelf_collection, tombstone_collection
+from util.hk_time_now import server_timestamp
+from util.tombstone import insert_tombstones, tombstone
+from util.versioning import VersionCheck, version_etag
+from util.compact import RecordsResponse
+from util.etag import collection_etag, etag_matches
 
 shelf_router = APIRouter(
     prefix="/shelves",
@@ -27,7 +32,12 @@ async def create_shelf(shelf: ShelfModel = Body(...)):
     new_shelf = await shelf_collection.insert_one(
         shelf.model_dump(by_alias=True, exclude=["id"])
     )
-    created_shelf = await shelf_collection.find_one({"_id": new_shelf.inserted_id})
+    # Stamped by the MongoDB clock, the client's `last_updated` is not kept
+    created_shelf = await shelf_collection.find_one_and_update(
+        {"_id": new_shelf.inserted_id},
+        server_timestamp("last_updated"),
+        return_document=ReturnDocument.AFTER,
+    )
     return created_shelf
 
 
@@ -37,13 +47,24 @@ async def create_shelf(shelf: ShelfModel = Body(...)):
     response_model=ShelfCollection,
     response_model_by_alias=False,
 )
-async def list_shelves():
+async def list_shelves(request: Request):
     """
     List all of the shelf data in the database.
 
     The response is unpaginated and limited to 1000 results.
+    Send the returned `ETag` as `If-None-Match` to get a `304 Not Modified`
+    when nothing has changed.
     """
-    return ShelfCollection(shelves=await shelf_collection.find().to_list(1000))
+    etag = await collection_etag(shelf_collection, tombstone_collection)
+    if etag_matches(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    shelves = await shelf_collection.find().to_list(1000)
+    return RecordsResponse(
+        {"shelves": [ShelfRecord.from_doc(s) for s in shelves]}, headers={"ETag": etag}
+    )
 
 
 @shelf_router.get(
@@ -52,11 +73,12 @@ async def list_shelves():
     response_model=ShelfModel,
     response_model_by_alias=False,
 )
-async def show_shelf(id: str):
+async def show_shelf(id: str, response: Response):
     """
     Get the record for a specific shelf, looked up by `id`.
     """
     if (shelf := await shelf_collection.find_one({"_id": ObjectId(id)})) is not None:
+        response.headers["ETag"] = version_etag(shelf.get("version", 0))
         return shelf
 
     raise HTTPException(status_code=404, detail=f"Shelf {id} not found")
@@ -68,31 +90,47 @@ async def show_shelf(id: str):
     response_model=ShelfModel,
     response_model_by_alias=False,
 )
-async def update_shelf(id: str, shelf: UpdateShelfModel = Body(...)):
+async def update_shelf(
+    id: str, request: Request, response: Response, shelf: UpdateShelfModel = Body(...)
+):
     """
     Update individual fields of an existing shelf record.
 
     Only the provided fields will be updated.
     Any missing or `null` fields will be ignored.
+
+    The update only applies if the shelf is still at the version given in
+    `If-Match` or in the `version` field; otherwise it fails with 412 or 409.
     """
+    check = VersionCheck(request, shelf.version)
+    query = {"_id": ObjectId(id)}
     shelf = {k: v for k, v in shelf.model_dump(by_alias=True).items() if v is not None}
+    shelf.pop("version", None)
 
     if len(shelf) >= 1:
+        shelf.pop("last_updated", None)
         update_result = await shelf_collection.find_one_and_update(
-            {"_id": ObjectId(id)},
-            {"$set": shelf},
+            {**query, **check.filter()},
+            {
+                "$set": shelf,
+                "$inc": {"version": 1},
+                **server_timestamp("last_updated"),
+            },
             return_document=ReturnDocument.AFTER,
         )
-        if update_result is not None:
-            return update_result
-        else:
-            raise HTTPException(status_code=404, detail=f"Shelf {id} not found")
+        if update_result is None:
+            raise await check.failure(shelf_collection, query, "Shelf", id)
+
+        response.headers["ETag"] = version_etag(update_result["version"])
+        return update_result
 
     # The update is empty, but we should still return the matching document:
-    if (existing_shelf := await shelf_collection.find_one({"_id": id})) is not None:
-        return existing_shelf
+    existing_shelf = await shelf_collection.find_one({**query, **check.filter()})
+    if existing_shelf is None:
+        raise await check.failure(shelf_collection, query, "Shelf", id)
 
-    raise HTTPException(status_code=404, detail=f"Shelf {id} not found")
+    response.headers["ETag"] = version_etag(existing_shelf.get("version", 0))
+    return existing_shelf
 
 
 @shelf_router.delete("/{id}", response_description="Delete a shelf")
@@ -103,6 +141,7 @@ async def delete_shelf(id: str):
     delete_result = await shelf_collection.delete_one({"_id": ObjectId(id)})
 
     if delete_result.deleted_count == 1:
+        await insert_tombstones(tombstone_collection, [tombstone("shelves", id)])
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     raise HTTPException(status_code=404, detail=f"Shelf {id} not found")
@@ -0,0 +1,181 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException, Query
+from app import (
+    db,
+    bag_collection,
+    box_collection,
+    prisoner_collection,
+    shelf_collection,
+    tombstone_collection,
+)
+from schemas.bag import BagRecord
+from schemas.box import BoxRecord
+from schemas.prisoner import PrisonerRecord
+from schemas.shelf import ShelfRecord
+from schemas.sync import SyncModel
+from util.compact import RecordsResponse
+from util.hk_time_now import server_now
+from util.tombstone import TOMBSTONE_TTL
+
+# Changes are re-sent for a short window before the checkpoint. The checkpoint
+# and all timestamps come from the MongoDB clock, but a write stamped just
+# before the checkpoint may only become visible after the queries ran.
+# Re-applying a change on the client is harmless.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Documents and deleted ids per page, by default and at most
+SYNC_PAGE_SIZE = 1000
+MAX_SYNC_PAGE_SIZE = 10000
+
+# Parts of a sync, in the order they are paged through: response field,
+# collection, record type and the timestamp deltas are selected by.
+# Deletions are only sent with deltas.
+SYNC_PARTS = [
+    ("bags", bag_collection, BagRecord, "last_updated"),
+    ("boxes", box_collection, BoxRecord, "last_updated"),
+    ("prisoners", prisoner_collection, PrisonerRecord, "last_updated"),
+    ("shelves", shelf_collection, ShelfRecord, "last_updated"),
+    ("deleted", tombstone_collection, None, "deleted_at"),
+]
+
+sync_router = APIRouter(
+    prefix="/sync",
+    tags=["Sync"],
+)
+
+
+# The position of a paged sync, as an opaque string: the checkpoint and lower
+# bound of the first page, the part being read and the sort key of the last
+# document sent from it
+def encode_cursor(checkpoint, since, part, after):
+    state = {
+        "checkpoint": checkpoint.isoformat(),
+        "since": since and since.isoformat(),
+        "part": part,
+        "after": [
+            after[0].isoformat() if isinstance(after[0], datetime) else None,
+            str(after[1]),
+        ],
+    }
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        checkpoint = datetime.fromisoformat(state["checkpoint"])
+        since = state["since"] and datetime.fromisoformat(state["since"])
+        part = int(state["part"])
+        timestamp, id = state["after"]
+        after = (timestamp and datetime.fromisoformat(timestamp), ObjectId(id))
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+    if not 0 <= part < len(SYNC_PARTS):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+    return checkpoint, since, part, after
+
+
+# Query and sort for one page of a part. A full resync pages through `_id`,
+# a delta through (timestamp, `_id`), after the last document already sent.
+def page_query(field, since, after):
+    if since is None:
+        query = {}
+        if after is not None:
+            query["_id"] = {"$gt": after[1]}
+        return query, [("_id", 1)]
+
+    query = {field: {"$gt": since}}
+    if after is not None:
+        timestamp, id = after
+        query = {
+            "$and": [
+                query,
+                {
+                    "$or": [
+                        {field: {"$gt": timestamp}},
+                        {field: timestamp, "_id": {"$gt": id}},
+                    ]
+                },
+            ]
+        }
+    return query, [(field, 1), ("_id", 1)]
+
+
+@sync_router.get(
+    "/",
+    response_description="Get changes since a checkpoint",
+    response_model=SyncModel,
+    response_model_by_alias=False,
+)
+async def sync(
+    since: Optional[datetime] = Query(None),
+    limit: int = Query(SYNC_PAGE_SIZE, gt=0, le=MAX_SYNC_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+):
+    """
+    Get every bag, box, prisoner and shelf changed since `since`, plus the ids
+    of documents deleted since then.
+
+    Leave out `since` for the initial download. Timestamps without a
+    timezone are taken as UTC. Responses are compressed when the client
+    sends `Accept-Encoding`.
+
+    Each response holds at most `limit` documents and deleted ids. While
+    `next_cursor` is set there is more: pass it back as `cursor` (`since` is
+    then ignored) and keep the `checkpoint` of the last page.
+    """
+    if cursor is not None:
+        checkpoint, since, part, after = decode_cursor(cursor)
+    else:
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        checkpoint = await server_now(db)
+        if since is not None and since < checkpoint - TOMBSTONE_TTL:
+            since = None
+        elif since is not None:
+            since = since - SYNC_OVERLAP
+        part, after = 0, None
+    full_resync = since is None
+
+    content = {
+        "checkpoint": checkpoint,
+        "full_resync": full_resync,
+        "bags": [],
+        "boxes": [],
+        "prisoners": [],
+        "shelves": [],
+        "deleted": {"bags": [], "boxes": [], "prisoners": [], "shelves": []},
+        "next_cursor": None,
+    }
+    remaining = limit
+    while part < len(SYNC_PARTS):
+        name, collection, record, field = SYNC_PARTS[part]
+        if record is None and full_resync:
+            break
+        query, sort = page_query(field, since, after)
+        projection = (
+            {"collection": 1, "document_id": 1, field: 1} if record is None else None
+        )
+        docs = collection.find(query, projection).sort(sort).limit(remaining)
+        last = None
+        async for doc in docs:
+            if record is None:
+                content["deleted"][doc["collection"]].append(doc["document_id"])
+            else:
+                content[name].append(record.from_doc(doc))
+            last = doc
+            remaining -= 1
+        if remaining == 0:
+            content["next_cursor"] = encode_cursor(
+                checkpoint, since, part, (last.get(field), last["_id"])
+            )
+            break
+        part, after = part + 1, None
+
+    return RecordsResponse(content)
@@ -0,0 +1,60 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+from datetime import datetime
+
+from util.py_objectid import PyObjectId
+from util.compact import compact_model
+
+
+class AuditEntityModel(BaseModel):
+    """
+    The document an audit log entry is about.
+
+    `type` is the collection name, e.g. `boxes`.
+    """
+
+    type: str
+    id: str
+
+
+class AuditEntryModel(BaseModel):
+    """
+    A single audit log entry.
+
+    `action` is one of `update`, `move` or `discharge`. `changes` holds the
+    fields that were written and, where known, `previous` their old values.
+    """
+
+    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    ts: datetime
+    entity: AuditEntityModel
+    action: str
+    actor: Optional[PyObjectId] = None
+    changes: dict = Field(default={})
+    previous: Optional[dict] = None
+
+    model_config = {
+        "populate_by_name": True,
+        "json_schema_extra": {
+            "example": {
+                "ts": "2023-04-23T12:00:00Z",
+                "entity": {"type": "boxes", "id": "6627c8ee88dd306b763be9aa"},
+                "action": "move",
+                "actor": "000000006175647265793032",
+                "changes": {"shelf_id": "507f1f77bcf86cd799439014"},
+                "previous": {"shelf_id": "507f1f77bcf86cd799439013"},
+            }
+        },
+    }
+
+
+class AuditCollection(BaseModel):
+    """
+    A container holding a list of `AuditEntryModel` instances, newest first.
+    """
+
+    entries: list[AuditEntryModel]
+
+
+# Lightweight read-only counterpart of `AuditEntryModel` for list responses
+AuditEntryRecord = compact_model(AuditEntryModel)
@@ -6,6 +6,7 @@ from pydantic.functional_validators import BeforeValidator
 from datetime import datetime
 
 from util.hk_time_now import hk_time_now
+from util.compact import compact_model
 
 # Represents an ObjectId field in the database.
 # It will be represented as a `str` on the model so that it can be serialized to JSON.
@@ -29,6 +30,7 @@ class BagModel(BaseModel):
     prisoner_id: PyObjectId = Field(...)
     last_updated: datetime = Field(default_factory=hk_time_now)
     last_updated_by: str = Field(...)
+    version: int = Field(default=0)
 
     model_config = {
         "populate_by_name": True,
@@ -61,6 +63,7 @@ class UpdateBagModel(BaseModel):
     prisoner_id: Optional[PyObjectId] = None
     last_updated: Optional[datetime] = None
     last_updated_by: Optional[str] = None
+    version: Optional[int] = None
 
     model_config = {
         "arbitrary_types_allowed": True,
@@ -88,3 +91,36 @@ class BagCollection(BaseModel):
     """
 
     bags: list[BagModel]
+
+
+class BagLookupModel(BaseModel):
+    """
+    A batch of RFID EPCs to look bags up by.
+    """
+
+    rfid_epcs: List[str] = Field(..., min_length=1)
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "rfid_epcs": ["12345678", "12345679"],
+            }
+        },
+    }
+
+
+class BagLookupResult(BaseModel):
+    """
+    Bags found for a batch lookup.
+
+    `missing` lists EPCs with no matching bag and `invalid` lists EPCs that
+    are too long to be a bag id.
+    """
+
+    bags: list[BagModel]
+    missing: list[str]
+    invalid: list[str]
+
+
+# Lightweight read-only counterpart of `BagModel` for list responses
+BagRecord = compact_model(BagModel)
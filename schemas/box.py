@@ -6,6 +6,7 @@ from pydantic.functional_validators import BeforeValidator
 from datetime import datetime
 
 from util.hk_time_now import hk_time_now
+from util.compact import compact_model
 
 # Represents an ObjectId field in the database.
 # It will be represented as a `str` on the model so that it can be serialized to JSON.
@@ -25,6 +26,7 @@ class BoxModel(BaseModel):
     shelf_id: PyObjectId = Field(...)
     last_updated: datetime = Field(default_factory=hk_time_now)
     last_updated_by: PyObjectId = Field(...)
+    version: int = Field(default=0)
 
     model_config = {
         "populate_by_name": True,
@@ -49,6 +51,7 @@ class UpdateBoxModel(BaseModel):
     shelf_id: Optional[PyObjectId] = None
     last_updated: Optional[datetime] = None
     last_updated_by: Optional[PyObjectId] = None
+    version: Optional[int] = None
 
     model_config = {
         "arbitrary_types_allowed": True,
@@ -72,3 +75,49 @@ class BoxCollection(BaseModel):
     """
 
     boxes: list[BoxModel]
+
+
+class MoveBoxesModel(BaseModel):
+    """
+    A request to move several boxes onto a single shelf.
+    """
+
+    box_ids: List[PyObjectId] = Field(..., min_length=1)
+    shelf_id: PyObjectId = Field(...)
+    last_updated_by: PyObjectId = Field(...)
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "box_ids": ["6627c8ee88dd306b763be9aa", "6627c8ee88dd306b763be9ab"],
+                "shelf_id": "507f1f77bcf86cd799439014",
+                "last_updated_by": "000000006175647265793032",
+            }
+        },
+    }
+
+
+class BoxMoveResult(BaseModel):
+    """
+    The outcome of moving a single box.
+
+    `status` is one of `moved`, `unchanged` (already on the target shelf),
+    `not_found` or `invalid_id`.
+    """
+
+    id: str
+    status: str
+
+
+class MoveBoxesResult(BaseModel):
+    """
+    The outcome of a bulk box move.
+    """
+
+    shelf_id: PyObjectId
+    moved: int
+    results: list[BoxMoveResult]
+
+
+# Lightweight read-only counterpart of `BoxModel` for list responses
+BoxRecord = compact_model(BoxModel)
@@ -0,0 +1,25 @@
+from pydantic import BaseModel, Field
+
+
+class ImportRowError(BaseModel):
+    """
+    A row that failed validation. `row` counts data rows from 1.
+    """
+
+    row: int
+    error: str
+
+
+class ImportResult(BaseModel):
+    """
+    The outcome of a bulk import.
+
+    `duplicates` counts rows whose id already existed and were skipped.
+    `errors` lists the first 100 invalid rows, `invalid` counts all of them.
+    """
+
+    inserted: int
+    updated: int
+    duplicates: int
+    invalid: int
+    errors: list[ImportRowError] = Field(default=[])
@@ -4,6 +4,8 @@ from bson import ObjectId
 from typing_extensions import Annotated
 from pydantic.functional_validators import BeforeValidator
 
+from util.compact import compact_model
+
 # Represents an ObjectId field in the database.
 # It will be represented as a `str` on the model so that it can be serialized to JSON.
 PyObjectId = Annotated[str, BeforeValidator(str)]
@@ -24,6 +26,7 @@ class OfficerModel(BaseModel):
     first_name: str = Field(...)
     last_name: str = Field(...)
     officer_rank: str = Field(...)
+    version: int = Field(default=0)
 
     model_config = {
         "populate_by_name": True,
@@ -48,6 +51,7 @@ class UpdateOfficerModel(BaseModel):
     first_name: Optional[str] = None
     last_name: Optional[str] = None
     officer_rank: Optional[str] = None
+    version: Optional[int] = None
 
     model_config = {
         "arbitrary_types_allowed": True,
@@ -104,3 +108,7 @@ class SignupModel(LoginModel):
             }
         },
     }
+
+
+# Lightweight read-only counterpart of `OfficerModel` for list responses
+OfficerRecord = compact_model(OfficerModel)
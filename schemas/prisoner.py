@@ -6,6 +6,8 @@ from pydantic.functional_validators import BeforeValidator
 from datetime import datetime
 
 from util.hk_time_now import hk_time_now
+from util.compact import compact_model
+from schemas.bag import BagModel
 
 # Represents an ObjectId field in the database.
 # It will be represented as a `str` on the model so that it can be serialized to JSON.
@@ -28,6 +30,9 @@ class PrisonerModel(BaseModel):
     last_updated: datetime = Field(default_factory=hk_time_now)
     last_updated_by: PyObjectId = Field(...)
     officer_id: PyObjectId = Field(...)
+    discharged: bool = Field(default=False)
+    date_discharged: Optional[datetime] = None
+    version: int = Field(default=0)
 
     model_config = {
         "populate_by_name": True,
@@ -58,6 +63,7 @@ class UpdatePrisonerModel(BaseModel):
     last_updated: Optional[datetime] = None
     last_updated_by: Optional[PyObjectId] = None
     officer_id: Optional[PyObjectId] = None
+    version: Optional[int] = None
 
     model_config = {
         "arbitrary_types_allowed": True,
@@ -84,3 +90,62 @@ class PrisonerCollection(BaseModel):
     """
 
     prisoners: list[PrisonerModel]
+
+
+class DischargeModel(BaseModel):
+    """
+    The officer performing a prisoner discharge.
+    """
+
+    last_updated_by: PyObjectId = Field(...)
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "last_updated_by": "000000006175647265793032",
+            }
+        },
+    }
+
+
+class DischargeManifest(BaseModel):
+    """
+    Everything released to a prisoner on discharge.
+    """
+
+    prisoner: PrisonerModel
+    bags: list[BagModel]
+    box_ids: list[PyObjectId]
+
+
+class PrisonerLookupModel(BaseModel):
+    """
+    A batch of government ID numbers to look prisoners up by.
+    """
+
+    id_numbers: List[str] = Field(..., min_length=1)
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "id_numbers": ["12345678", "87654321"],
+            }
+        },
+    }
+
+
+class PrisonerLookupResult(BaseModel):
+    """
+    Prisoners found for a batch lookup.
+
+    `missing` lists ID numbers with no matching prisoner and `invalid` lists
+    ID numbers that are too long to be a prisoner id.
+    """
+
+    prisoners: list[PrisonerModel]
+    missing: list[str]
+    invalid: list[str]
+
+
+# Lightweight read-only counterpart of `PrisonerModel` for list responses
+PrisonerRecord = compact_model(PrisonerModel)
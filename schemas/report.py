@@ -0,0 +1,36 @@
+from typing import Optional
+from pydantic import BaseModel
+from datetime import datetime
+
+
+class BagReportRow(BaseModel):
+    """
+    Bag totals for one officer, box or day.
+
+    `average_storage_hours` is the average time since registration of the
+    bags still in storage.
+    """
+
+    key: Optional[str]
+    count: int
+    average_storage_hours: float
+
+
+class BagReport(BaseModel):
+    """
+    A report served from the bag rollup.
+
+    `refreshed_at` is when the rollup was last brought up to date.
+    """
+
+    refreshed_at: Optional[datetime]
+    rows: list[BagReportRow]
+
+
+class ReportRefreshResult(BaseModel):
+    """
+    The state of the bag rollup after a refresh.
+    """
+
+    refreshed_at: datetime
+    last_full_rebuild: datetime
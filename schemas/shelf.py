@@ -6,6 +6,7 @@ from pydantic.functional_validators import BeforeValidator
 from datetime import datetime
 
 from util.hk_time_now import hk_time_now
+from util.compact import compact_model
 
 # Represents an ObjectId field in the database.
 # It will be represented as a `str` on the model so that it can be serialized to JSON.
@@ -22,6 +23,7 @@ class ShelfModel(BaseModel):
     shelf_name: str = Field(..., min_length=1)
     last_updated: datetime = Field(default_factory=hk_time_now)
     last_updated_by: PyObjectId = Field(...)
+    version: int = Field(default=0)
 
     model_config = {
         "populate_by_name": True,
@@ -46,6 +48,7 @@ class UpdateShelfModel(BaseModel):
     shelf_name: Optional[str] = None
     last_updated: Optional[datetime] = None
     last_updated_by: Optional[PyObjectId] = None
+    version: Optional[int] = None
 
     model_config = {
         "arbitrary_types_allowed": True,
@@ -69,3 +72,7 @@ class ShelfCollection(BaseModel):
     """
 
     shelves: list[ShelfModel]
+
+
+# Lightweight read-only counterpart of `ShelfModel` for list responses
+ShelfRecord = compact_model(ShelfModel)
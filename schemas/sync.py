@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, Field
+
+from schemas.bag import BagModel
+from schemas.box import BoxModel
+from schemas.prisoner import PrisonerModel
+from schemas.shelf import ShelfModel
+
+
+class DeletedIds(BaseModel):
+    """
+    Ids of documents deleted since the checkpoint, per collection.
+    """
+
+    bags: list[str] = Field(default=[])
+    boxes: list[str] = Field(default=[])
+    prisoners: list[str] = Field(default=[])
+    shelves: list[str] = Field(default=[])
+
+
+class SyncModel(BaseModel):
+    """
+    Everything that changed since a checkpoint.
+
+    Pass `checkpoint` back as `since` on the next sync. When `full_resync` is
+    set the client's checkpoint was too old to compute a delta: the pages
+    hold every document and the client should replace its local copy.
+
+    While `next_cursor` is set the sync continues on another page, fetched by
+    passing it back as `cursor`.
+    """
+
+    checkpoint: datetime
+    full_resync: bool
+    bags: list[BagModel]
+    boxes: list[BoxModel]
+    prisoners: list[PrisonerModel]
+    shelves: list[ShelfModel]
+    deleted: DeletedIds
+    next_cursor: Optional[str] = None
@@ -0,0 +1,148 @@
+import asyncio
+import io
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+from util.bulk_io import (
+    BULK_COLLECTIONS,
+    iter_export,
+    read_batches,
+    to_document,
+    validate_rows,
+)
+from util.create_objectid import create_objectid
+
+NOW = datetime(2024, 1, 1)
+
+BAGS = [
+    {
+        "_id": create_objectid(epc),
+        "rfid_epc": epc,
+        "box_id": ObjectId("6627c8ee88dd306b763be9aa"),
+        "date_registered": datetime(2023, 4, 23, 11, 0),
+        "items": items,
+        "officer_id": "johndoe",
+        "prisoner_id": ObjectId("000000004631323334353637"),
+        "last_updated": datetime(2023, 4, 23, 12, 0, 0, 123000),
+        "last_updated_by": "johndoe",
+        "version": 2,
+    }
+    for epc, items in [("12345678", ["2 pens", 'a "quoted", item']), ("87654321", [])]
+]
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def batch_size(self, size):
+        return self
+
+    async def __aiter__(self):
+        for document in self.documents:
+            yield document
+
+
+class Collection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self):
+        return Cursor(self.documents)
+
+
+def export(fmt, documents):
+    async def run():
+        return b"".join(
+            [
+                chunk
+                async for chunk in iter_export(
+                    Collection(documents), BULK_COLLECTIONS["bags"], fmt, batch_size=1
+                )
+            ]
+        )
+
+    return asyncio.run(run())
+
+
+def reimport(fmt, data):
+    result = {"invalid": 0, "errors": []}
+    documents = []
+    for rows in read_batches(io.BytesIO(data), fmt, batch_size=1):
+        documents += validate_rows(BULK_COLLECTIONS["bags"], rows, 1, result)
+    assert result == {"invalid": 0, "errors": []}
+    return documents
+
+
+def naive_utc(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# MongoDB stores aware and naive (UTC) timestamps alike. `last_updated` is
+# stamped by the import.
+def comparable(document):
+    return {
+        key: naive_utc(value)
+        for key, value in document.items()
+        if key != "last_updated"
+    }
+
+
+def normalized(document):
+    return {
+        key: str(value) if isinstance(value, ObjectId) and key != "_id" else value
+        for key, value in comparable(document).items()
+    }
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_export_import_round_trip(fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    documents = reimport(fmt, export(fmt, BAGS))
+    assert [comparable(doc) for doc in documents] == [normalized(bag) for bag in BAGS]
+
+
+def test_to_document_derives_the_id_and_parses_lists():
+    row = {
+        "id": "",
+        "rfid_epc": "12345678",
+        "box_id": "6627c8ee88dd306b763be9aa",
+        "date_registered": "2023-04-23T11:00:00+00:00",
+        "items": '["2 pens"]',
+        "officer_id": "johndoe",
+        "prisoner_id": "000000004631323334353637",
+        "last_updated": "2020-01-01T00:00:00+00:00",
+        "last_updated_by": "johndoe",
+        "version": "",
+    }
+    document = to_document(BULK_COLLECTIONS["bags"], row, NOW, ["items"])
+    assert document["_id"] == create_objectid("12345678")
+    assert document["items"] == ["2 pens"]
+    assert document["last_updated"] == NOW
+    # Empty cells fall back to the model defaults
+    assert document["version"] == 0
+    assert "id" not in document
+
+
+def test_to_document_uses_the_id_column_or_a_new_id():
+    schema = BULK_COLLECTIONS["boxes"]
+    row = {
+        "shelf_id": "507f1f77bcf86cd799439014",
+        "last_updated_by": "000000006175647265793032",
+    }
+    given = to_document(schema, {**row, "id": "6627c8ee88dd306b763be9aa"}, NOW, [])
+    assert given["_id"] == ObjectId("6627c8ee88dd306b763be9aa")
+    assert isinstance(to_document(schema, row, NOW, [])["_id"], ObjectId)
+
+
+def test_invalid_rows_are_reported_by_number():
+    result = {"invalid": 0, "errors": []}
+    rows = [{"rfid_epc": "12345678"}, {"rfid_epc": "x" * 13}]
+    assert validate_rows(BULK_COLLECTIONS["bags"], rows, 5, result) == []
+    assert result["invalid"] == 2
+    assert [error["row"] for error in result["errors"]] == [5, 6]
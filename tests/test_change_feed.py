@@ -0,0 +1,69 @@
+from bson import ObjectId
+
+from util.change_feed import matches, to_event
+
+BOX_ID = ObjectId()
+SHELF = "A1"
+
+
+def change(operation="update", document=None, previous=None):
+    change = {
+        "_id": {"_data": "8263"},
+        "operationType": operation,
+        "ns": {"db": "test_db", "coll": "boxes"},
+        "documentKey": {"_id": BOX_ID},
+    }
+    if document is not None:
+        change["fullDocument"] = document
+    if previous is not None:
+        change["fullDocumentBeforeChange"] = previous
+    return change
+
+
+def test_to_event_is_shaped_like_the_api():
+    event = to_event(change(document={"_id": BOX_ID, "shelf_id": SHELF}))
+    assert event == {
+        "id": "8263",
+        "collection": "boxes",
+        "operation": "update",
+        "document_id": str(BOX_ID),
+        "document": {"id": str(BOX_ID), "shelf_id": SHELF},
+        "previous": None,
+    }
+
+
+def test_to_event_skips_events_without_a_document():
+    drop = {
+        "_id": {"_data": "8264"},
+        "operationType": "drop",
+        "ns": {"db": "test_db", "coll": "boxes"},
+    }
+    assert to_event(drop) is None
+
+
+def test_matches_by_id():
+    event = to_event(change())
+    assert matches(event, {"box_id": str(BOX_ID)})
+    assert not matches(event, {"box_id": str(ObjectId())})
+
+
+def test_matches_the_document_or_the_pre_image():
+    moved = to_event(
+        change(document={"shelf_id": "B2"}, previous={"shelf_id": SHELF})
+    )
+    assert matches(moved, {"shelf_id": SHELF})
+    assert matches(moved, {"shelf_id": "B2"})
+    deleted = to_event(change("delete", previous={"shelf_id": SHELF}))
+    assert matches(deleted, {"shelf_id": SHELF})
+    assert not matches(to_event(change("delete")), {"shelf_id": SHELF})
+
+
+def test_filters_on_other_collections_do_not_match():
+    event = to_event(change(document={"shelf_id": SHELF}))
+    assert not matches(event, {"prisoner_id": "123"})
+
+
+def test_all_filters_must_match():
+    event = to_event(change(document={"shelf_id": SHELF}))
+    assert matches(event, {"shelf_id": SHELF, "box_id": str(BOX_ID)})
+    assert not matches(event, {"shelf_id": "B2", "box_id": str(BOX_ID)})
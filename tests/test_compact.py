@@ -0,0 +1,65 @@
+import dataclasses
+import json
+from datetime import datetime
+
+from bson import ObjectId
+
+from schemas.bag import BagCollection, BagModel, BagRecord
+from schemas.box import BoxModel, BoxRecord
+from util.compact import RecordsResponse
+
+BAG = {
+    "_id": ObjectId("000000003132333435363738"),
+    "rfid_epc": "12345678",
+    "box_id": ObjectId("6627c8ee88dd306b763be9aa"),
+    "date_registered": datetime(2023, 4, 23, 11, 0),
+    "items": ["2 pens", "1 notebook"],
+    "officer_id": "johndoe",
+    "prisoner_id": ObjectId("000000004631323334353637"),
+    "last_updated": datetime(2023, 4, 23, 12, 0, 0, 123000),
+    "last_updated_by": "johndoe",
+    "version": 3,
+}
+
+
+def model_json(model):
+    return json.loads(model.model_dump_json(by_alias=False))
+
+
+def records_json(content):
+    return json.loads(RecordsResponse(content).body)
+
+
+def test_record_has_the_model_fields():
+    assert [field.name for field in dataclasses.fields(BagRecord)] == list(
+        BagModel.model_fields
+    )
+
+
+def test_records_serialize_like_the_models():
+    expected = model_json(BagCollection(bags=[BagModel(**BAG)]))
+    assert records_json({"bags": [BagRecord.from_doc(BAG)]}) == expected
+
+
+def test_missing_fields_use_the_model_defaults():
+    bag = {key: value for key, value in BAG.items() if key not in ("items", "version")}
+    record = BagRecord.from_doc(bag)
+    assert record.items == []
+    assert record.version == 0
+    # Default lists are not shared between records
+    assert record.items is not BagRecord.from_doc(bag).items
+    assert records_json(record) == model_json(BagModel(**bag))
+
+
+def test_object_ids_and_optional_fields():
+    box = {
+        "_id": ObjectId("6627c8ee88dd306b763be9aa"),
+        "last_date_accessed": None,
+        "shelf_id": ObjectId("507f1f77bcf86cd799439014"),
+        "last_updated": datetime(2023, 4, 23, 12, 0),
+        "last_updated_by": ObjectId("000000006175647265793032"),
+    }
+    record = BoxRecord.from_doc(box)
+    assert record.id == "6627c8ee88dd306b763be9aa"
+    assert record.last_date_accessed is None
+    assert records_json(record) == model_json(BoxModel(**box))
@@ -0,0 +1,52 @@
+import pytest
+
+from util import compression
+from util.compression import encoded_etag, negotiate
+
+
+@pytest.fixture(autouse=True)
+def all_encoders(monkeypatch):
+    # Whether zstandard and brotli are installed must not change the results
+    monkeypatch.setattr(
+        compression, "ENCODERS", dict.fromkeys(["zstd", "br", "gzip"], bytes)
+    )
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("gzip, br", "br"),
+        ("gzip, br, zstd", "zstd"),
+        ("*", "zstd"),
+        ("GZIP", "gzip"),
+        ("gzip;q=1.0, zstd;q=0.5", "gzip"),
+        ("br;q=0.8, gzip;q=0.9", "gzip"),
+        ("zstd;q=0.5, br;q=0.5", "zstd"),
+        ("zstd;q=0, gzip", "gzip"),
+        ("*;q=0.1, gzip;q=0.5", "gzip"),
+        ("*, zstd;q=0", "br"),
+        ("gzip;q=0", None),
+        ("gzip;q=bad", None),
+    ],
+)
+def test_negotiate(header, expected):
+    assert negotiate(header) == expected
+
+
+def test_negotiate_uses_installed_encoders(monkeypatch):
+    monkeypatch.setattr(compression, "ENCODERS", {"gzip": bytes})
+    assert negotiate("zstd, br, gzip;q=0.1") == "gzip"
+    assert negotiate("zstd, br") is None
+
+
+def test_encoded_etag():
+    headers = [(b"etag", b'"abc"'), (b"content-type", b"application/json")]
+    assert encoded_etag(headers, "br") == [
+        (b"etag", b'"abc-br"'),
+        (b"content-type", b"application/json"),
+    ]
+    # Weak ETags do not change with the encoding
+    assert encoded_etag([(b"etag", b'W/"abc"')], "gzip") == [(b"etag", b'W/"abc"')]
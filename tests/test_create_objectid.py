@@ -0,0 +1,48 @@
+import pytest
+from bson import ObjectId
+
+from util.create_objectid import create_objectid, create_objectids
+
+
+# The derivation used before ids were built from the raw bytes. Existing bags
+# and prisoners are stored under these ids, so the two must agree.
+def original_create_objectid(s):
+    return ObjectId(str(s).encode("utf-8").hex().zfill(24))
+
+
+IDS = [
+    "",
+    "0",
+    "12345678",
+    "A1234567",
+    "000000000001",
+    "E28011606000",
+    "ab\0cd",
+    "香港身份",
+    12345678,
+]
+
+
+@pytest.mark.parametrize("value", IDS)
+def test_matches_original_derivation(value):
+    assert create_objectid(value) == original_create_objectid(value)
+
+
+def test_rejects_more_than_12_bytes():
+    with pytest.raises(ValueError):
+        create_objectid("1234567890123")
+    # 5 characters, 15 bytes
+    with pytest.raises(ValueError):
+        create_objectid("香港身份證")
+
+
+def test_batch_matches_single():
+    ids, invalid = create_objectids(IDS + ["1234567890123"])
+    assert ids == {str(value): create_objectid(value) for value in IDS}
+    assert invalid == ["1234567890123"]
+
+
+def test_batch_removes_duplicates():
+    ids, invalid = create_objectids(["1", "1", 1, "2"])
+    assert list(ids) == ["1", "2"]
+    assert invalid == []
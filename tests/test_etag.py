@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+import pytest
+
+from util.etag import etag_matches
+
+
+def request(if_none_match=None):
+    headers = {} if if_none_match is None else {"if-none-match": if_none_match}
+    return SimpleNamespace(headers=headers)
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, False),
+        ('"abc"', True),
+        ('"abd"', False),
+        ("*", True),
+        ('W/"abc"', True),
+        ('"abc-gzip"', True),
+        ('"abc-br"', True),
+        ('"abc-zstd"', True),
+        ('"abc-deflate"', False),
+        ('"xyz", "abc-gzip"', True),
+        ('"xyz", "uvw"', False),
+        ("abc", False),
+    ],
+)
+def test_etag_matches(header, expected):
+    assert etag_matches(request(header), '"abc"') is expected
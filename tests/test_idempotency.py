@@ -0,0 +1,213 @@
+import asyncio
+import datetime
+import json
+
+from pymongo.errors import DuplicateKeyError
+
+from util import idempotency
+from util.idempotency import IdempotencyMiddleware, request_hash
+
+
+class Collection:
+    """Just enough of a Motor collection for the middleware, keyed by `_id`"""
+
+    def __init__(self):
+        self.documents = {}
+
+    @staticmethod
+    def _key(id):
+        return json.dumps(id, sort_keys=True)
+
+    def _matches(self, query):
+        document = self.documents.get(self._key(query["_id"]))
+        if document is None:
+            return None
+        if all(document.get(k) == v for k, v in query.items() if k != "_id"):
+            return document
+        return None
+
+    async def find_one(self, query):
+        return self._matches(query)
+
+    async def insert_one(self, document):
+        key = self._key(document["_id"])
+        if key in self.documents:
+            raise DuplicateKeyError("duplicate key")
+        self.documents[key] = dict(document)
+
+    async def update_one(self, query, update):
+        document = self._matches(query)
+        if document is not None:
+            document.update(update["$set"])
+        return type("Result", (), {"modified_count": int(document is not None)})
+
+    async def delete_one(self, query):
+        if self._matches(query) is not None:
+            del self.documents[self._key(query["_id"])]
+
+
+def scope(path="/bags", key=b"abc", method="POST"):
+    headers = [] if key is None else [(b"idempotency-key", key)]
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": headers,
+    }
+
+
+class App:
+    """Counts its calls and answers 201 with `response`"""
+
+    def __init__(self, response=b'{"ok": true}', status=201):
+        self.response = response
+        self.status = status
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        message = await receive()
+        assert not message["more_body"]
+        await send(
+            {"type": "http.response.start", "status": self.status, "headers": []}
+        )
+        await send({"type": "http.response.body", "body": self.response})
+
+
+def call(middleware, scope, body=b"{}", chunks=None):
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": True}
+        for chunk in chunks or []
+    ]
+    messages.append({"type": "http.request", "body": body, "more_body": False})
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    start = sent[0]
+    return start["status"], dict(start["headers"]), b"".join(
+        message.get("body", b"") for message in sent[1:]
+    )
+
+
+def test_request_hash_covers_method_path_query_and_body():
+    base = request_hash(scope(), b"{}")
+    assert request_hash(scope(), b"{}") == base
+    assert request_hash(scope(method="PUT"), b"{}") != base
+    assert request_hash(scope(path="/boxes"), b"{}") != base
+    assert request_hash({**scope(), "query_string": b"a=1"}, b"{}") != base
+    assert request_hash(scope(), b"{ }") != base
+
+
+def test_retry_is_replayed():
+    app = App()
+    middleware = IdempotencyMiddleware(app, Collection())
+    first = call(middleware, scope())
+    status, headers, body = call(middleware, scope())
+    assert app.calls == 1
+    assert (status, body) == (first[0], first[2])
+    assert headers[b"idempotent-replayed"] == b"true"
+
+
+def test_key_reused_for_a_different_body_gets_422():
+    app = App()
+    middleware = IdempotencyMiddleware(app, Collection())
+    call(middleware, scope())
+    status, _, _ = call(middleware, scope(), b'{"other": 1}')
+    assert status == 422
+    assert app.calls == 1
+
+
+def test_keys_are_scoped_by_route():
+    app = App()
+    middleware = IdempotencyMiddleware(app, Collection())
+    call(middleware, scope("/bags"))
+    status, _, _ = call(middleware, scope("/boxes"))
+    assert status == 201
+    assert app.calls == 2
+
+
+def test_retry_while_in_progress_gets_409():
+    collection = Collection()
+    middleware = IdempotencyMiddleware(App(), collection)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    asyncio.run(
+        collection.insert_one(
+            {
+                "_id": {"route": "POST /bags", "key": "abc"},
+                "request_hash": request_hash(scope(), b"{}"),
+                "completed": False,
+                "created_at": now,
+                "claimed_at": now,
+            }
+        )
+    )
+    status, headers, _ = call(middleware, scope())
+    assert status == 409
+    assert headers[b"retry-after"] == b"1"
+
+
+def test_stale_claim_is_taken_over():
+    app = App()
+    collection = Collection()
+    middleware = IdempotencyMiddleware(app, collection)
+    claimed = datetime.datetime.now(datetime.timezone.utc) - 2 * (
+        idempotency.IDEMPOTENCY_LEASE
+    )
+    asyncio.run(
+        collection.insert_one(
+            {
+                "_id": {"route": "POST /bags", "key": "abc"},
+                "request_hash": request_hash(scope(), b"{}"),
+                "completed": False,
+                "created_at": claimed,
+                "claimed_at": claimed,
+            }
+        )
+    )
+    status, _, _ = call(middleware, scope())
+    assert status == 201
+    assert app.calls == 1
+
+
+def test_server_errors_release_the_key():
+    app = App(status=503)
+    collection = Collection()
+    middleware = IdempotencyMiddleware(app, collection)
+    call(middleware, scope())
+    assert collection.documents == {}
+
+
+def test_requests_without_a_key_or_excluded_pass_through():
+    app = App()
+    collection = Collection()
+    middleware = IdempotencyMiddleware(app, collection, exclude=["/bulk/"])
+    call(middleware, scope(key=None))
+    call(middleware, scope("/bulk/bags/import"))
+    assert app.calls == 2
+    assert collection.documents == {}
+
+
+def test_large_request_gets_413(monkeypatch):
+    monkeypatch.setattr(idempotency, "MAX_REQUEST_SIZE", 4)
+    app = App()
+    middleware = IdempotencyMiddleware(app, Collection())
+    status, _, _ = call(middleware, scope(), b"345", chunks=[b"12"])
+    assert status == 413
+    assert app.calls == 0
+
+
+def test_large_response_is_not_stored(monkeypatch):
+    monkeypatch.setattr(idempotency, "MAX_STORED_RESPONSE", 4)
+    app = App(response=b"12345")
+    collection = Collection()
+    middleware = IdempotencyMiddleware(app, collection)
+    status, _, body = call(middleware, scope())
+    assert (status, body) == (201, b"12345")
+    assert collection.documents == {}
@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from util import rate_limit
+from util.rate_limit import InMemoryRateLimitBackend, RateLimit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def take(backend, key="client", rate=2.0, burst=3):
+    return asyncio.run(backend.take(key, rate, burst))
+
+
+def test_burst_then_limited(clock):
+    backend = InMemoryRateLimitBackend()
+    assert [take(backend)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = take(backend)
+    assert not allowed
+    # An empty bucket refills one token in 1 / rate seconds
+    assert retry_after == pytest.approx(0.5)
+
+
+def test_refills_at_rate(clock):
+    backend = InMemoryRateLimitBackend()
+    for _ in range(3):
+        take(backend)
+    clock.now += 0.25
+    allowed, retry_after = take(backend)
+    assert not allowed
+    assert retry_after == pytest.approx(0.25)
+    clock.now += 0.25
+    assert take(backend) == (True, 0.0)
+
+
+def test_refill_is_capped_at_burst(clock):
+    backend = InMemoryRateLimitBackend()
+    take(backend)
+    clock.now += 3600
+    assert [take(backend)[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_buckets_are_per_key(clock):
+    backend = InMemoryRateLimitBackend()
+    for _ in range(3):
+        take(backend, "a")
+    assert not take(backend, "a")[0]
+    assert take(backend, "b")[0]
+
+
+def test_prune_drops_only_full_buckets(clock, monkeypatch):
+    monkeypatch.setattr(InMemoryRateLimitBackend, "MAX_KEYS", 2)
+    backend = InMemoryRateLimitBackend()
+    take(backend, "old")
+    clock.now += 10
+    take(backend, "recent")
+    take(backend, "new")
+    # The next take prunes: "old" has refilled completely, the others have not
+    take(backend, "newest")
+    assert set(backend.buckets) == {"recent", "new", "newest"}
+
+
+def test_deferred_charge(clock):
+    limit = RateLimit("test", InMemoryRateLimitBackend(), rate=1, burst=1, charge=False)
+    request = SimpleNamespace(client=SimpleNamespace(host="10.0.0.1"))
+
+    async def run():
+        # The dependency itself takes no token
+        for _ in range(3):
+            async for _ in limit(request):
+                pass
+        await limit.charge(request)
+        with pytest.raises(HTTPException) as e:
+            await limit.charge(request)
+        return e.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 429
+    assert error.headers == {"Retry-After": "1"}
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+from util.versioning import VersionCheck, if_match_versions, version_etag
+
+
+def request(if_match=None):
+    headers = {} if if_match is None else {"if-match": if_match}
+    return SimpleNamespace(headers=headers)
+
+
+def test_version_etag():
+    assert version_etag(3) == '"3"'
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("*", None),
+        ('"3"', [3]),
+        ('W/"3"', []),
+        ('W/"3", "4"', [4]),
+        ('"3-gzip"', [3]),
+        ('"3-zstd", "4"', [3, 4]),
+        ('"abc"', []),
+        ('"abc", "5"', [5]),
+    ],
+)
+def test_if_match_versions(header, expected):
+    assert if_match_versions(header) == expected
+
+
+def test_unconditional_without_header_or_body_version():
+    check = VersionCheck(request())
+    assert check.filter() == {}
+    assert not check.precondition
+
+
+def test_body_version():
+    check = VersionCheck(request(), 2)
+    assert check.filter() == {"version": {"$in": [2]}}
+    assert not check.precondition
+
+
+def test_header_takes_precedence_over_body():
+    check = VersionCheck(request('"5"'), 2)
+    assert check.filter() == {"version": {"$in": [5]}}
+    assert check.precondition
+
+
+def test_version_0_matches_documents_without_a_version():
+    check = VersionCheck(request(), 0)
+    assert check.filter() == {"version": {"$in": [0, None]}}
+
+
+def test_if_match_star_only_requires_existence():
+    check = VersionCheck(request("*"))
+    assert check.filter() == {}
+    assert check.precondition
+
+
+def test_if_match_without_known_versions_matches_nothing():
+    check = VersionCheck(request('"abc"'))
+    assert check.filter() == {"version": {"$in": []}}
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+# Create an audit log entry. `entity` is the collection name of the changed
+# document and `changes` holds the fields that were written.
+def audit_entry(entity, entity_id, action, actor, changes=None, previous=None):
+    entry = {
+        "ts": datetime.now(timezone.utc),
+        "entity": {"type": entity, "id": str(entity_id)},
+        "action": action,
+        "actor": actor,
+        "changes": changes or {},
+    }
+    if previous is not None:
+        entry["previous"] = previous
+    return entry
+
+
+class AuditWriter:
+    """
+    Append-only audit log written in batches off the request path.
+
+    `record` only queues the entry. A background task inserts queued entries
+    with one unordered `insert_many` once `batch_size` entries are waiting or
+    `flush_interval` seconds after the first one arrived. When `max_queue`
+    entries are waiting, `record` waits for the writer instead of dropping
+    entries.
+
+    Entries go to a time-series collection keyed on the entity, so a query
+    for one entity and time range only reads that entity's buckets.
+    """
+
+    def __init__(
+        self,
+        db,
+        name="audit_log",
+        batch_size=500,
+        flush_interval=1.0,
+        max_queue=10_000,
+        retries=3,
+    ):
+        self.db = db
+        self.name = name
+        self.collection = db.get_collection(name)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.retries = retries
+        self._task = None
+
+    async def create_collection(self):
+        try:
+            await self.db.create_collection(
+                self.name,
+                timeseries={
+                    "timeField": "ts",
+                    "metaField": "entity",
+                    "granularity": "seconds",
+                },
+            )
+        except CollectionInvalid:
+            pass
+        await self.collection.create_index([("entity.id", 1), ("ts", -1)])
+
+    async def record(self, entry):
+        await self.queue.put(entry)
+
+    async def record_many(self, entries):
+        for entry in entries:
+            await self.queue.put(entry)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        Write out everything still queued, then stop the background task.
+        """
+        if self._task is None or self._task.done():
+            return
+        # None marks the end of the queue
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _next(self, timeout):
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else deadline - loop.time()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    entry = await self._next(timeout)
+                except asyncio.TimeoutError:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+                if deadline is None:
+                    deadline = loop.time() + self.flush_interval
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch):
+        for attempt in range(self.retries):
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+                return
+            except BulkWriteError as e:
+                # Retry only the entries that did not get in. Duplicate ids
+                # were written by an earlier attempt that reported an error.
+                failed = {
+                    error["index"]
+                    for error in e.details["writeErrors"]
+                    if error["code"] != DUPLICATE_KEY
+                }
+                if not failed:
+                    return
+                batch = [entry for i, entry in enumerate(batch) if i in failed]
+                logger.warning("Audit log write failed for %d entries", len(batch))
+            except PyMongoError:
+                logger.exception("Audit log write failed")
+            await asyncio.sleep(2**attempt)
+        logger.error("Dropping %d audit log entries after retries", len(batch))
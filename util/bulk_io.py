@@ -0,0 +1,448 @@
+"""
+Stream collections to CSV or Parquet and import them back in chunks.
+
+    python -m util.bulk_io export bags [--format parquet] [-o bags.parquet]
+    python -m util.bulk_io import bags bags.csv [--upsert]
+
+Exports read the collection with a batched cursor and encode one batch at a
+time, so memory stays bounded however large the collection is. Imports
+validate each chunk of rows against the collection's schema and write it
+with one unordered bulk operation. Parquet needs the optional `pyarrow`
+package.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import operator
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Annotated, NamedTuple, Optional, Union, get_args, get_origin
+
+import motor.motor_asyncio
+from bson import ObjectId
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from pydantic_core import to_json
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+from schemas.bag import BagModel, BagRecord
+from schemas.box import BoxModel, BoxRecord
+from schemas.prisoner import PrisonerModel, PrisonerRecord
+from schemas.shelf import ShelfModel, ShelfRecord
+from util.create_objectid import create_objectid
+from util.hk_time_now import hk_time_now, server_timestamp
+
+FORMATS = ("csv", "parquet")
+MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# Documents per cursor batch, encoded chunk and bulk write
+BATCH_SIZE = 5000
+
+# Row errors returned by an import, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+DUPLICATE_KEY = 11000
+
+# Version of a document after an upsert replaced it, 0 for a new document
+NEXT_VERSION = {"$add": [{"$ifNull": ["$version", -1]}, 1]}
+
+
+class BulkSchema(NamedTuple):
+    model: type[BaseModel]
+    record: type
+    # Field the `_id` is derived from with `create_objectid`, like the create
+    # routes do. Otherwise the `id` column is used, or a new id generated.
+    id_field: Optional[str] = None
+
+
+# Collections that can be exported and imported. Officers are left out since
+# their documents hold passwords.
+BULK_COLLECTIONS = {
+    "bags": BulkSchema(BagModel, BagRecord, "rfid_epc"),
+    "boxes": BulkSchema(BoxModel, BoxRecord),
+    "prisoners": BulkSchema(PrisonerModel, PrisonerRecord, "id_number"),
+    "shelves": BulkSchema(ShelfModel, ShelfRecord),
+}
+
+
+# Strip Optional/Annotated wrappers from a field annotation
+def base_type(annotation):
+    if get_origin(annotation) is Annotated:
+        return base_type(get_args(annotation)[0])
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return base_type(args[0])
+    return annotation
+
+
+def is_list(annotation):
+    return get_origin(base_type(annotation)) is list
+
+
+def csv_datetime(value):
+    if value.tzinfo is None:
+        return value.isoformat() + "+00:00"
+    return value.isoformat()
+
+
+def csv_json(value):
+    return to_json(value).decode()
+
+
+# Encoder for the cells of a CSV column: lists as JSON, timestamps as ISO 8601.
+# None where the csv module's own formatting will do (it writes None as "").
+def csv_encoder(annotation):
+    annotation = base_type(annotation)
+    if annotation is datetime:
+        return csv_datetime
+    if get_origin(annotation) in (list, dict) or annotation in (list, dict):
+        return csv_json
+    return None
+
+
+def arrow_type(annotation):
+    annotation = base_type(annotation)
+    if get_origin(annotation) is list:
+        return pyarrow.list_(arrow_type(get_args(annotation)[0]))
+    return {
+        bool: pyarrow.bool_(),
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        datetime: pyarrow.timestamp("ms", tz="UTC"),
+    }.get(annotation, pyarrow.string())
+
+
+def arrow_schema(model):
+    return pyarrow.schema(
+        [
+            pyarrow.field(name, arrow_type(field.annotation))
+            for name, field in model.model_fields.items()
+        ]
+    )
+
+
+class ChunkSink:
+    """
+    Write-only file that collects what is written to it, so an encoder's
+    output can be streamed as it is produced.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+async def record_batches(collection, schema, batch_size=BATCH_SIZE):
+    batch = []
+    async for document in collection.find().batch_size(batch_size):
+        batch.append(schema.record.from_doc(document))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def iter_csv(collection, schema, batch_size=BATCH_SIZE):
+    names = list(schema.model.model_fields)
+    values = operator.attrgetter(*names)
+    encoders = [
+        (i, encoder)
+        for i, field in enumerate(schema.model.model_fields.values())
+        if (encoder := csv_encoder(field.annotation)) is not None
+    ]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+
+    def encode(batch):
+        rows = []
+        for record in batch:
+            row = list(values(record))
+            for i, encoder in encoders:
+                if row[i] is not None:
+                    row[i] = encoder(row[i])
+            rows.append(row)
+        writer.writerows(rows)
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    async for batch in record_batches(collection, schema, batch_size):
+        yield await run_in_threadpool(encode, batch)
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def iter_parquet(collection, schema, batch_size=BATCH_SIZE):
+    names = list(schema.model.model_fields)
+    arrow = arrow_schema(schema.model)
+    sink = ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, arrow)
+
+    # Each batch becomes one row group
+    def encode(batch):
+        columns = {name: [getattr(record, name) for record in batch] for name in names}
+        writer.write_table(pyarrow.table(columns, schema=arrow))
+        return sink.drain()
+
+    try:
+        async for batch in record_batches(collection, schema, batch_size):
+            yield await run_in_threadpool(encode, batch)
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(collection, schema, fmt, batch_size=BATCH_SIZE):
+    if fmt == "parquet":
+        return iter_parquet(collection, schema, batch_size)
+    return iter_csv(collection, schema, batch_size)
+
+
+# Read timestamps back as naive UTC datetimes, the way MongoDB returns them.
+# pyarrow converts those about twice as fast as timezone-aware ones.
+def naive_timestamps(schema):
+    return pyarrow.schema(
+        [
+            field.with_type(pyarrow.timestamp(field.type.unit))
+            if pyarrow.types.is_timestamp(field.type)
+            else field
+            for field in schema
+        ]
+    )
+
+
+# Read rows from a file in batches of dicts
+def read_batches(file, fmt, batch_size=BATCH_SIZE):
+    if fmt == "parquet":
+        parquet = pyarrow.parquet.ParquetFile(file)
+        schema = naive_timestamps(parquet.schema_arrow)
+        for batch in parquet.iter_batches(batch_size):
+            yield pyarrow.Table.from_batches([batch]).cast(schema).to_pylist()
+        return
+
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    batch = []
+    for row in reader:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Validate a row against the collection schema and turn it into a document
+def to_document(schema, row, now, list_fields):
+    values = {key: value for key, value in row.items() if value not in ("", None)}
+    # CSV cells hold lists as JSON
+    for name in list_fields:
+        if isinstance(values.get(name), str):
+            values[name] = json.loads(values[name])
+
+    model = schema.model.model_validate(values)
+    document = model.model_dump(by_alias=True, exclude={"id"})
+    if schema.id_field is not None:
+        document["_id"] = create_objectid(getattr(model, schema.id_field))
+    elif model.id is not None:
+        document["_id"] = ObjectId(model.id)
+    else:
+        document["_id"] = ObjectId()
+    # Replaced by the MongoDB clock once written, see write_documents
+    if "last_updated" in document:
+        document["last_updated"] = now
+    return document
+
+
+def row_error(error):
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors()
+        )
+    return str(error)
+
+
+def validate_rows(schema, rows, first_row, result):
+    now = hk_time_now()
+    list_fields = [
+        name
+        for name, field in schema.model.model_fields.items()
+        if is_list(field.annotation)
+    ]
+    documents = []
+    for number, row in enumerate(rows, first_row):
+        try:
+            documents.append(to_document(schema, row, now, list_fields))
+        except (ValidationError, ValueError, InvalidId) as e:
+            result["invalid"] += 1
+            if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                result["errors"].append({"row": number, "error": row_error(e)})
+    return documents
+
+
+def without(document, *fields):
+    return {key: value for key, value in document.items() if key not in fields}
+
+
+async def write_documents(collection, documents, upsert, result):
+    if upsert:
+        # Existing documents are replaced, fields missing from the file are
+        # dropped. Their version is kept and incremented, so PUTs based on the
+        # version before the import fail their check.
+        written = await collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": doc["_id"]},
+                    [
+                        {
+                            "$replaceWith": {
+                                "$mergeObjects": [
+                                    {"$literal": without(doc, "version")},
+                                    {"version": NEXT_VERSION},
+                                ]
+                            }
+                        }
+                    ],
+                    upsert=True,
+                )
+                for doc in documents
+            ],
+            ordered=False,
+        )
+        result["inserted"] += written.upserted_count
+        result["updated"] += written.matched_count
+        written_ids = [doc["_id"] for doc in documents]
+    else:
+        try:
+            await collection.insert_many(documents, ordered=False)
+            written_ids = [doc["_id"] for doc in documents]
+            result["inserted"] += len(written_ids)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+            duplicates = {error["index"] for error in errors}
+            written_ids = [
+                doc["_id"]
+                for index, doc in enumerate(documents)
+                if index not in duplicates
+            ]
+            result["inserted"] += e.details["nInserted"]
+            result["duplicates"] += len(errors)
+
+    # Imported documents count as changed, for delta sync and list ETags. Like
+    # the create routes, `last_updated` is set by the MongoDB clock.
+    if written_ids:
+        await collection.update_many(
+            {"_id": {"$in": written_ids}}, server_timestamp("last_updated")
+        )
+
+
+async def import_file(
+    collection, schema, file, fmt, upsert=False, batch_size=BATCH_SIZE
+):
+    """
+    Import a CSV or Parquet file into `collection`.
+
+    Rows that fail validation are skipped and reported by row number (the
+    first data row is 1). Without `upsert`, rows whose `_id` already exists
+    are counted as duplicates and left alone. With it, they are replaced.
+    """
+    result = {"inserted": 0, "updated": 0, "duplicates": 0, "invalid": 0, "errors": []}
+    batches = read_batches(file, fmt, batch_size)
+    first_row = 1
+    while (rows := await run_in_threadpool(next, batches, None)) is not None:
+        documents = await run_in_threadpool(
+            validate_rows, schema, rows, first_row, result
+        )
+        if documents:
+            await write_documents(collection, documents, upsert, result)
+        first_row += len(rows)
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("collection", choices=BULK_COLLECTIONS)
+    export_parser.add_argument("--format", choices=FORMATS, default="csv")
+    export_parser.add_argument("-o", "--output", help="file to write, default stdout")
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("collection", choices=BULK_COLLECTIONS)
+    import_parser.add_argument("file")
+    import_parser.add_argument(
+        "--format", choices=FORMATS, help="default from the file extension"
+    )
+    import_parser.add_argument(
+        "--upsert", action="store_true", help="replace documents that exist"
+    )
+    for command in (export_parser, import_parser):
+        command.add_argument("--database", default="test_db")
+        command.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format
+    if args.command == "import" and fmt is None:
+        fmt = "parquet" if args.file.endswith(".parquet") else "csv"
+    if fmt == "parquet" and pyarrow is None:
+        parser.error("Parquet needs the pyarrow package")
+
+    load_dotenv(Path(".env"))
+    client = motor.motor_asyncio.AsyncIOMotorClient(os.getenv("MONGODB_URI"))
+    collection = client[args.database].get_collection(args.collection)
+    schema = BULK_COLLECTIONS[args.collection]
+
+    if args.command == "export":
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        with output:
+            async for chunk in iter_export(collection, schema, fmt, args.batch_size):
+                output.write(chunk)
+        return
+
+    with open(args.file, "rb") as file:
+        result = await import_file(
+            collection, schema, file, fmt, args.upsert, args.batch_size
+        )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
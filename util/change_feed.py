@@ -0,0 +1,249 @@
+import asyncio
+import logging
+from collections import deque
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Server error code for a resume token that has fallen off the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# Server error code for an unknown option, returned for
+# `fullDocumentBeforeChange` by servers older than 6.0
+UNKNOWN_FIELD = 40415
+
+# Operations on single documents. Others, like a `drop` or `rename` of a
+# watched collection, have no document and are not passed on.
+DOCUMENT_OPERATIONS = ["insert", "update", "replace", "delete"]
+
+# Which document field each subscriber filter is matched against, per collection
+FILTER_FIELDS = {
+    "shelf_id": {"shelves": "_id", "boxes": "shelf_id"},
+    "box_id": {"boxes": "_id", "bags": "box_id"},
+    "prisoner_id": {"prisoners": "_id", "bags": "prisoner_id"},
+}
+
+
+# A document from a change stream, shaped like the API models
+def to_api_document(document):
+    if document is None:
+        return None
+    document = jsonable_encoder(document, custom_encoder={ObjectId: str})
+    document["id"] = document.pop("_id", None)
+    return document
+
+
+# Turn a raw change stream document into an API-shaped event. `previous` is
+# the document before an update or delete, when pre-images are enabled.
+# Returns None for events that are not about a single document.
+def to_event(change):
+    if "documentKey" not in change:
+        return None
+    return {
+        "id": change["_id"]["_data"],
+        "collection": change["ns"]["coll"],
+        "operation": change["operationType"],
+        "document_id": str(change["documentKey"]["_id"]),
+        "document": to_api_document(change.get("fullDocument")),
+        "previous": to_api_document(change.get("fullDocumentBeforeChange")),
+    }
+
+
+# Check an event against a subscriber's filters (all given filters must match).
+# A field filter matches the document before or after the change, so a
+# subscriber to a shelf also sees a box being deleted or moved off it.
+def matches(event, filters):
+    for key, value in filters.items():
+        field = FILTER_FIELDS[key].get(event["collection"])
+        if field is None:
+            return False
+        if field == "_id":
+            if event["document_id"] != value:
+                return False
+        elif not any(
+            document is not None and document.get(field) == value
+            for document in (event["document"], event["previous"])
+        ):
+            return False
+    return True
+
+
+class Subscriber:
+    """
+    A single client of the change feed with a bounded event buffer.
+
+    When the buffer overflows the subscriber is dropped, rather than letting
+    a slow consumer hold events in memory or slow down everybody else.
+    """
+
+    def __init__(self, filters, buffer_size):
+        self.filters = filters
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+    def offer(self, event):
+        if self.dropped or not matches(event, self.filters):
+            return True
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            return False
+
+
+class ChangeFeed:
+    """
+    One MongoDB change stream per worker, fanned out to all subscribers.
+
+    The stream is opened lazily on the first subscription and resumes from its
+    last token if the connection drops. A short history of recent events is
+    kept so reconnecting clients can resume from their last event id.
+
+    The stream is closed `idle_timeout` seconds after the last subscriber
+    leaves. The history is cleared then, since events after that point are
+    never seen.
+    """
+
+    def __init__(
+        self, db, collections, buffer_size=256, history_size=1024, idle_timeout=30
+    ):
+        self.db = db
+        self.collections = collections
+        self.buffer_size = buffer_size
+        self.idle_timeout = idle_timeout
+        self.history = deque(maxlen=history_size)
+        self.subscribers = set()
+        self.resume_token = None
+        # Cleared if the server does not support pre-images
+        self.pre_images = True
+        self._task = None
+        self._idle_handle = None
+
+    async def enable_pre_images(self):
+        """
+        Have MongoDB record pre-images for the watched collections, so that
+        delete events and updates that change a filtered field can be matched
+        against the document as it was. Needs MongoDB 6.0 and the `collMod`
+        privilege; without them filtered subscribers miss those events, and
+        on older servers the stream is watched without pre-images.
+        """
+        for name in self.collections:
+            try:
+                await self.db.command(
+                    "collMod", name, changeStreamPreAndPostImages={"enabled": True}
+                )
+            except OperationFailure as e:
+                logger.warning("Could not enable pre-images on %s: %s", name, e)
+
+    def subscribe(self, filters, last_event_id=None):
+        """
+        Register a subscriber. Returns the subscriber and whether its
+        `last_event_id` could be resumed from the history.
+        """
+        subscriber = Subscriber(filters, self.buffer_size)
+        resumed = last_event_id is None
+        if last_event_id is not None:
+            ids = [event["id"] for event in self.history]
+            if last_event_id in ids:
+                resumed = True
+                for event in list(self.history)[ids.index(last_event_id) + 1 :]:
+                    subscriber.offer(event)
+
+        self.subscribers.add(subscriber)
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscriber, resumed
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        self._schedule_idle_stop()
+
+    def publish(self, event):
+        self.history.append(event)
+        for subscriber in list(self.subscribers):
+            if not subscriber.offer(event):
+                logger.warning("Dropping slow change feed subscriber")
+                self.subscribers.discard(subscriber)
+        self._schedule_idle_stop()
+
+    def _schedule_idle_stop(self):
+        if self.subscribers or self._task is None or self._idle_handle is not None:
+            return
+        self._idle_handle = asyncio.get_running_loop().call_later(
+            self.idle_timeout, self._stop_idle
+        )
+
+    def _stop_idle(self):
+        self._idle_handle = None
+        if self.subscribers or self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self.resume_token = None
+        self.history.clear()
+
+    async def stop(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        pipeline = [
+            {
+                "$match": {
+                    "ns.coll": {"$in": self.collections},
+                    "operationType": {"$in": DOCUMENT_OPERATIONS},
+                }
+            }
+        ]
+        while True:
+            try:
+                async with self.db.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    full_document_before_change=(
+                        "whenAvailable" if self.pre_images else None
+                    ),
+                    resume_after=self.resume_token,
+                ) as stream:
+                    async for change in stream:
+                        self.resume_token = stream.resume_token
+                        event = to_event(change)
+                        if event is not None:
+                            self.publish(event)
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Change stream history lost, restarting from now")
+                    self.resume_token = None
+                    continue
+                if (
+                    isinstance(e, OperationFailure)
+                    and e.code == UNKNOWN_FIELD
+                    and self.pre_images
+                ):
+                    logger.warning(
+                        "Server does not support pre-images, watching without"
+                    )
+                    self.pre_images = False
+                    continue
+                logger.exception("Change stream failed, reopening")
+                await asyncio.sleep(1)
+            except Exception:
+                # Anything else would end the shared task silently and leave
+                # every subscriber with only keepalives
+                logger.exception("Change stream failed, reopening")
+                await asyncio.sleep(1)
@@ -0,0 +1,78 @@
+import dataclasses
+from typing import Annotated, get_args, get_origin
+
+from fastapi.responses import JSONResponse
+from pydantic.functional_validators import BeforeValidator
+from pydantic_core import to_json
+
+
+class CompactRecord:
+    """
+    Base for the slotted read-only records generated by `compact_model`.
+
+    Records are built straight from database documents without validation,
+    so they are only meant for the DB -> JSON read path. Request bodies are
+    still validated with the Pydantic models.
+    """
+
+    __slots__ = ()
+    # (field name, document key, coerce to str) for every field
+    _fields = ()
+    _defaults = {}
+
+    @classmethod
+    def from_doc(cls, doc):
+        values = []
+        for name, key, coerce in cls._fields:
+            if key in doc:
+                value = doc[key]
+                if coerce and value is not None:
+                    value = str(value)
+            else:
+                value = cls._defaults[name].get_default(call_default_factory=True)
+            values.append(value)
+        return cls(*values)
+
+
+# Whether a field is validated with `BeforeValidator(str)` (e.g. PyObjectId),
+# looking through Optional/Union annotations
+def coerces_to_str(annotation, metadata=()):
+    if any(isinstance(m, BeforeValidator) and m.func is str for m in metadata):
+        return True
+    if get_origin(annotation) is Annotated:
+        base, *extra = get_args(annotation)
+        return coerces_to_str(base, extra)
+    return any(coerces_to_str(arg) for arg in get_args(annotation))
+
+
+# Generate a slotted dataclass with the same fields as a Pydantic model.
+# Fields are read from documents by their alias (e.g. `_id` for `id`), fields
+# validated with `BeforeValidator(str)` (PyObjectId) are converted to `str`,
+# and missing fields fall back to the model's defaults.
+def compact_model(model):
+    fields = tuple(
+        (name, field.alias or name, coerces_to_str(field.annotation, field.metadata))
+        for name, field in model.model_fields.items()
+    )
+    defaults = {
+        name: field
+        for name, field in model.model_fields.items()
+        if not field.is_required()
+    }
+    return dataclasses.make_dataclass(
+        model.__name__.removesuffix("Model") + "Record",
+        [name for name, _, _ in fields],
+        bases=(CompactRecord,),
+        namespace={"_fields": fields, "_defaults": defaults},
+        slots=True,
+    )
+
+
+class RecordsResponse(JSONResponse):
+    """
+    JSON response for content holding `CompactRecord`s, serialized by
+    pydantic-core without building or validating any models.
+    """
+
+    def render(self, content):
+        return to_json(content, fallback=str)
@@ -0,0 +1,151 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+# Content codings this middleware can produce
+CODINGS = ("zstd", "br", "gzip")
+
+# Available encoders, in order of preference when the client accepts several
+ENCODERS = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+if brotli is not None:
+    ENCODERS["br"] = lambda body: brotli.compress(body, quality=4)
+ENCODERS["gzip"] = lambda body: gzip.compress(body, compresslevel=6)
+
+# Content that is already compressed or must not be buffered
+SKIP_CONTENT_TYPES = ("image/", "text/event-stream")
+
+
+# Pick the encoding with the highest q-value in an Accept-Encoding header. Ties
+# go to our order of preference, zstd > br > gzip.
+def negotiate(accept_encoding):
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0
+    for coding in ENCODERS:
+        quality = accepted.get(coding, accepted.get("*", 0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+# Append the content coding to a strong ETag, e.g. "abc" -> "abc-gzip"
+def encoded_etag(headers, coding):
+    result = []
+    for key, value in headers:
+        if key == b"etag" and value.endswith(b'"') and not value.startswith(b"W/"):
+            value = value[:-1] + b"-" + coding.encode() + b'"'
+        result.append((key, value))
+    return result
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with zstd, brotli or gzip, whichever the client accepts.
+
+    zstd and brotli are used when the `zstandard` / `brotli` packages are
+    installed. Only complete (non-streaming) responses of at least
+    `minimum_size` bytes are compressed. A strong `ETag` gets the encoding
+    appended, since the compressed bytes differ from the identity body.
+    """
+
+    def __init__(self, app, minimum_size=1000):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    # Whether a response can be compressed, judged from its headers alone
+    def compressible(self, headers):
+        response_headers = dict(headers)
+        content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+        content_length = response_headers.get(b"content-length")
+        return not (
+            b"content-encoding" in response_headers
+            or content_type.startswith(SKIP_CONTENT_TYPES)
+            or (
+                content_length is not None
+                and content_length.isdigit()
+                and int(content_length) < self.minimum_size
+            )
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        coding = negotiate(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    passthrough = True
+                    message = {
+                        **message,
+                        "headers": encoded_etag(message["headers"], coding),
+                    }
+                    await send(message)
+                    return
+                # Responses that will not be compressed are forwarded right
+                # away, so streams such as /events get their headers at once
+                if not self.compressible(message["headers"]):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = ENCODERS[coding](body)
+            raw_headers = [
+                (k, v)
+                for k, v in encoded_etag(start_message["headers"], coding)
+                if k != b"content-length"
+            ]
+            raw_headers += [
+                (b"content-encoding", coding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+
+            await send({**start_message, "headers": raw_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,6 +1,30 @@
 from bson import ObjectId
 
+# An ObjectId is 12 bytes, longer custom strings cannot be encoded into one
+OBJECTID_LENGTH = 12
 
-# Create an bson.ObjectId from a custom string
+
+# Create an bson.ObjectId from a custom string.
+# Left-padding the raw bytes with zero bytes gives the same id as zero-filling
+# the hex string to 24 characters, without the hex round trip.
 def create_objectid(s):
-    return ObjectId(str(s).encode("utf-8").hex().zfill(24))
+    raw = str(s).encode("utf-8")
+    if len(raw) > OBJECTID_LENGTH:
+        raise ValueError(
+            f"'{s}' is longer than {OBJECTID_LENGTH} bytes and cannot be used as an id"
+        )
+    return ObjectId(raw.rjust(OBJECTID_LENGTH, b"\0"))
+
+
+# Create ObjectIds for many custom strings in one pass.
+# Returns a mapping of input to ObjectId and the inputs that were too long.
+def create_objectids(values):
+    ids = {}
+    invalid = []
+    for s in dict.fromkeys(str(v) for v in values):
+        raw = s.encode("utf-8")
+        if len(raw) > OBJECTID_LENGTH:
+            invalid.append(s)
+        else:
+            ids[s] = ObjectId(raw.rjust(OBJECTID_LENGTH, b"\0"))
+    return ids, invalid
@@ -0,0 +1,44 @@
+import hashlib
+
+from util.compression import CODINGS
+
+
+# Compute a strong ETag for the current state of a collection without reading
+# it: the newest `last_updated` (served from its index), the document count and
+# the newest deletion tombstone for the collection
+async def collection_etag(collection, tombstone_collection):
+    latest = await collection.find_one(
+        {}, {"last_updated": 1}, sort=[("last_updated", -1)]
+    )
+    deleted = await tombstone_collection.find_one(
+        {"collection": collection.name}, {"deleted_at": 1}, sort=[("deleted_at", -1)]
+    )
+    count = await collection.estimated_document_count()
+    marker = "|".join(
+        [
+            collection.name,
+            str(latest and latest.get("last_updated")),
+            str(deleted and deleted.get("deleted_at")),
+            str(count),
+        ]
+    )
+    return '"' + hashlib.blake2b(marker.encode(), digest_size=12).hexdigest() + '"'
+
+
+# Whether the request's If-None-Match header matches the current ETag.
+# Content-coding suffixes added by CompressionMiddleware are ignored.
+def etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        for coding in CODINGS:
+            suffix = f'-{coding}"'
+            if candidate.endswith(suffix):
+                candidate = candidate[: -len(suffix)] + '"'
+        if candidate == etag:
+            return True
+    return False
@@ -1,8 +1,23 @@
 import datetime
-import pytz
+from zoneinfo import ZoneInfo
+
+# Looked up once at import instead of on every call
+HONG_KONG_TZ = ZoneInfo("Asia/Hong_Kong")
 
 
 # Return the datetime in HK timezone
 def hk_time_now():
-    hong_kong_tz = pytz.timezone("Asia/Hong_Kong")
-    return datetime.datetime.now(tz=hong_kong_tz)
+    return datetime.datetime.now(tz=HONG_KONG_TZ)
+
+
+# Update operator that has MongoDB stamp the given fields with its own clock,
+# atomically with the rest of the update
+def server_timestamp(*fields):
+    return {"$currentDate": {field: True for field in fields}}
+
+
+# Current time by the MongoDB clock, for checkpoints that are compared with
+# timestamps set by `server_timestamp`
+async def server_now(db):
+    hello = await db.command("hello")
+    return hello["localTime"].replace(tzinfo=datetime.timezone.utc)
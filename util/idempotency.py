@@ -0,0 +1,298 @@
+import datetime
+import hashlib
+import json
+import logging
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+# How long a key and its stored response are kept
+IDEMPOTENCY_TTL = datetime.timedelta(hours=24)
+
+# How long a request holds its key while running. A claim that is older, left
+# by a worker that crashed or was killed, is taken over by the next retry.
+IDEMPOTENCY_LEASE = datetime.timedelta(seconds=60)
+
+# Methods whose requests may carry an `Idempotency-Key`
+IDEMPOTENT_METHODS = ("POST", "PUT", "PATCH")
+
+# Largest request body buffered to fingerprint a request. Larger requests with
+# a key get 413, streaming uploads should be excluded from the middleware.
+MAX_REQUEST_SIZE = 1024 * 1024
+
+# Largest response body stored for replay. A larger response is not stored and
+# its key is released, so a retry runs the request again. Keeps the stored
+# document well under MongoDB's 16 MB limit.
+MAX_STORED_RESPONSE = 1024 * 1024
+
+# Responses that say nothing about the outcome of the write and are not stored,
+# so a retry runs the request again
+TRANSIENT_STATUSES = (408, 429)
+
+
+# Hash of everything that identifies a request, to detect a key being reused
+# for a different request
+def request_hash(scope, body):
+    digest = hashlib.sha256()
+    digest.update(scope["method"].encode())
+    digest.update(b" ")
+    digest.update(scope["path"].encode())
+    digest.update(b"?")
+    digest.update(scope.get("query_string", b""))
+    digest.update(b"\n")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+async def send_json(send, status, detail, headers=()):
+    body = json.dumps({"detail": detail}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """
+    Make POST/PUT/PATCH requests with an `Idempotency-Key` header safe to retry.
+
+    The first request with a key runs normally and its response is stored in
+    `collection` under the key. A retry with the same key and the same method,
+    path and body gets the stored response back (with `Idempotent-Replayed:
+    true`) from a single `_id` lookup, without running the write again.
+
+    Keys are scoped to the method and path, so clients that happen to pick
+    the same key for different routes do not collide. They are not scoped to
+    the client: there is no authenticated identity, and a handheld's address
+    can change between a request and its retry.
+
+    - A key reused for a different request to the same route gets 422.
+    - A retry that arrives while the first request is still running gets 409
+      with `Retry-After`. If the first request has held the key for longer
+      than `IDEMPOTENCY_LEASE` its worker is assumed dead, and the retry
+      takes the key over and runs.
+    - 5xx, 408 and 429 responses are not stored, so those requests can be
+      retried with the same key.
+
+    - Request bodies over `MAX_REQUEST_SIZE` get 413. Responses over
+      `MAX_STORED_RESPONSE` are not stored and release the key.
+
+    Keys expire `IDEMPOTENCY_TTL` after first use through a TTL index on
+    `created_at`. Paths under `exclude` pass straight through; they are for
+    streaming uploads, which are never buffered here.
+    """
+
+    def __init__(self, app, collection, exclude=()):
+        self.app = app
+        self.collection = collection
+        self.exclude = tuple(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in IDEMPOTENT_METHODS
+            or scope["path"].startswith(self.exclude)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        key = request_headers.get(b"idempotency-key")
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        key = key.decode("latin-1")
+        if len(key) > 255:
+            await send_json(send, 400, "Idempotency-Key must be at most 255 characters")
+            return
+
+        too_large = (
+            f"Requests with an Idempotency-Key are limited to {MAX_REQUEST_SIZE} bytes"
+        )
+        content_length = request_headers.get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > MAX_REQUEST_SIZE:
+            await send_json(send, 413, too_large)
+            return
+        parts = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            part = message.get("body", b"")
+            size += len(part)
+            if size > MAX_REQUEST_SIZE:
+                await send_json(send, 413, too_large)
+                return
+            parts.append(part)
+            more_body = message.get("more_body", False)
+        body = b"".join(parts)
+        fingerprint = request_hash(scope, body)
+        key = {"route": f"{scope['method']} {scope['path']}", "key": key}
+
+        # Retries are answered from this one read. New keys are claimed with an
+        # insert, and losing an insert race means a concurrent request has it.
+        claimed_at = datetime.datetime.now(datetime.timezone.utc)
+        stored = await self.collection.find_one({"_id": key})
+        if stored is not None:
+            if not await self.take_over(stored, fingerprint, claimed_at):
+                await self.replay(stored, fingerprint, send)
+                return
+        else:
+            try:
+                await self.collection.insert_one(
+                    {
+                        "_id": key,
+                        "request_hash": fingerprint,
+                        "completed": False,
+                        "created_at": claimed_at,
+                        "claimed_at": claimed_at,
+                    }
+                )
+            except DuplicateKeyError:
+                stored = await self.collection.find_one({"_id": key})
+                await self.replay(stored, fingerprint, send)
+                return
+        claim = {"_id": key, "claimed_at": claimed_at}
+
+        # Hand the buffered body to the app, then fall back to the real
+        # receive so disconnects still come through
+        body_sent = False
+
+        async def buffered_receive():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status = None
+        headers = []
+        chunks = []
+        size = 0
+
+        async def send_and_record(message):
+            nonlocal status, headers, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = message.get("headers", [])
+            elif message["type"] == "http.response.body" and size is not None:
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size > MAX_STORED_RESPONSE:
+                    # Too large to store, the key is released below
+                    chunks.clear()
+                    size = None
+                else:
+                    chunks.append(chunk)
+            await send(message)
+
+        # Writes are conditional on the claim, which is gone if a retry took
+        # the key over after the lease ran out
+        try:
+            await self.app(scope, buffered_receive, send_and_record)
+        except BaseException:
+            await self.collection.delete_one(claim)
+            raise
+
+        if (
+            status is None
+            or status >= 500
+            or status in TRANSIENT_STATUSES
+            or size is None
+        ):
+            await self.collection.delete_one(claim)
+            return
+
+        # The response has been sent, so a failure here can only be logged.
+        # The key is released so that a retry is not stuck on a 409.
+        try:
+            await self.collection.update_one(
+                claim,
+                {
+                    "$set": {
+                        "completed": True,
+                        "status": status,
+                        "headers": [
+                            [k.decode("latin-1"), v.decode("latin-1")]
+                            for k, v in headers
+                        ],
+                        "body": b"".join(chunks),
+                    }
+                },
+            )
+        except PyMongoError:
+            logger.exception("Could not store response for %s", key)
+            await self.collection.delete_one(claim)
+
+    async def take_over(self, stored, fingerprint, claimed_at):
+        """
+        Claim a key whose request has been running for longer than the lease.
+        Returns whether the claim was taken; if so the request runs again.
+        """
+        claimed = stored.get("claimed_at", stored["created_at"])
+        if claimed.tzinfo is None:
+            claimed = claimed.replace(tzinfo=datetime.timezone.utc)
+        if (
+            stored["completed"]
+            or stored["request_hash"] != fingerprint
+            or claimed_at - claimed < IDEMPOTENCY_LEASE
+        ):
+            return False
+        result = await self.collection.update_one(
+            {
+                "_id": stored["_id"],
+                "completed": False,
+                "claimed_at": stored.get("claimed_at"),
+            },
+            {"$set": {"claimed_at": claimed_at}},
+        )
+        return result.modified_count == 1
+
+    async def replay(self, stored, fingerprint, send):
+        if stored is None:
+            # Expired or released between the insert and this read
+            await send_json(
+                send,
+                409,
+                "Request with this Idempotency-Key is being retried",
+                [(b"retry-after", b"1")],
+            )
+            return
+        if stored["request_hash"] != fingerprint:
+            await send_json(
+                send, 422, "Idempotency-Key was already used for a different request"
+            )
+            return
+        if not stored["completed"]:
+            await send_json(
+                send,
+                409,
+                "Request with this Idempotency-Key is still in progress",
+                [(b"retry-after", b"1")],
+            )
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": stored["status"],
+                "headers": [
+                    (k.encode("latin-1"), v.encode("latin-1"))
+                    for k, v in stored["headers"]
+                ]
+                + [(b"idempotent-replayed", b"true")],
+            }
+        )
+        await send({"type": "http.response.body", "body": bytes(stored["body"])})
@@ -0,0 +1,257 @@
+import asyncio
+import collections
+import hmac
+import re
+import sys
+import threading
+import time
+
+from util.idempotency import send_json
+
+
+# Time between samples while a profile is running
+SAMPLE_INTERVAL = 0.005
+
+# Longest profile the admin endpoint will run
+MAX_PROFILE_SECONDS = 60
+
+# Header carrying the admin token, on a request to profile it
+PROFILE_HEADER = b"x-profile"
+
+# Tasks currently running on each event loop. asyncio keeps this to answer
+# `current_task()`, reading it lets the sampler tell which task a stack is for.
+_current_tasks = getattr(asyncio.tasks, "_current_tasks", {})
+
+
+# Whether a token sent by a client is the admin token
+def token_matches(token, expected):
+    return expected is not None and hmac.compare_digest(
+        token.encode(), expected.encode()
+    )
+
+
+# Name of a thread as the root of its stacks. Pool threads only differ by a
+# trailing number, so they are merged.
+def thread_label(name):
+    return re.sub(r"[_-]\d+$", "", name)
+
+
+# Name of a task as the root of its stacks. Task names are numbered per
+# task, the coroutine they run is the same for every request.
+def task_label(task):
+    return getattr(task.get_coro(), "__qualname__", task.get_name())
+
+
+class Sampler:
+    """
+    Sampling profiler for the threads of this process.
+
+    A background thread reads the stack of every other thread each
+    `interval` seconds with `sys._current_frames()` and counts identical
+    stacks. Stacks are rooted at the thread name, and on the event loop
+    thread also at the task that was running, so event loop work and thread
+    pool work (image decoding, BSON decoding in the Motor executor) show up
+    side by side. Threads blocked in a `threading` wait are left out, which
+    drops idle pool workers.
+
+    If `task` is given, it is also sampled while suspended, from its chain
+    of awaiting coroutines, under "<label> (waiting)". That is the time a
+    request spends waiting on MongoDB or the thread pool.
+
+    `folded()` returns the counts in the collapsed stack format read by
+    flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, task=None, label="request"):
+        self.interval = interval
+        self.task = task
+        self.label = label
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started = None
+        self.duration = 0.0
+        self._frame_labels = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profiler", daemon=True
+        )
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        # At most one sample away
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        running = _current_tasks.get(self.loop)
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            codes = self._codes(frame)
+            if ident == self.loop_thread:
+                if running is None:
+                    root = ("event loop", "idle")
+                elif running is self.task:
+                    root = ("event loop", self.label)
+                else:
+                    root = ("event loop", f"task {task_label(running)}")
+            elif self._idle(codes):
+                continue
+            else:
+                root = (thread_label(names.get(ident, str(ident))),)
+            self.stacks[root + self._labels(codes)] += 1
+
+        if self.task is not None and running is not self.task:
+            codes = self._await_chain(self.task)
+            if codes:
+                self.stacks[(f"{self.label} (waiting)",) + self._labels(codes)] += 1
+        self.samples += 1
+
+    # Code objects of a thread's stack, outermost first
+    @staticmethod
+    def _codes(frame):
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        return codes
+
+    # Code objects of the coroutines a suspended task is awaiting, outermost
+    # first
+    @staticmethod
+    def _await_chain(task):
+        codes = []
+        coro = task.get_coro()
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+            if frame is None:
+                break
+            codes.append(frame.f_code)
+            coro = getattr(coro, "cr_await", None) or getattr(
+                coro, "gi_yieldfrom", None
+            )
+        return codes
+
+    @staticmethod
+    def _idle(codes):
+        return (
+            bool(codes)
+            and codes[-1].co_name == "wait"
+            and codes[-1].co_filename == threading.__file__
+        )
+
+    def _labels(self, codes):
+        return tuple(self._frame_label(code) for code in codes)
+
+    # `function (path/to/module.py:line)`, with the path relative to the
+    # sys.path entry it was imported from
+    def _frame_label(self, code):
+        label = self._frame_labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            for entry in sorted(filter(None, sys.path), key=len, reverse=True):
+                if filename.startswith(entry + "/"):
+                    filename = filename[len(entry) + 1 :]
+                    break
+            # `;` separates frames in the folded format
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+            label = label.replace(";", ",")
+            self._frame_labels[code] = label
+        return label
+
+    def folded(self):
+        return "".join(
+            f"{';'.join(stack)} {count}\n"
+            for stack, count in self.stacks.most_common()
+        )
+
+
+class ProfilerMiddleware:
+    """
+    Profile single requests on demand.
+
+    A request with an `X-Profile` header holding `token` runs normally under
+    a `Sampler`, but its response is replaced by the profile in collapsed
+    stack format. The route's status, the profile duration and the number of
+    samples are returned as `X-Profile-Status`, `X-Profile-Duration` and
+    `X-Profile-Samples`. A wrong token gets 403.
+
+    Without the header, or with no token configured, requests pass straight
+    through. Not for streaming responses, which never finish. Paths under
+    `exclude` are never profiled here: the window endpoint takes the same
+    header and runs its own sampler.
+    """
+
+    def __init__(self, app, token, interval=SAMPLE_INTERVAL, exclude=()):
+        self.app = app
+        self.token = token
+        self.interval = interval
+        self.exclude = tuple(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self.token is None
+            or scope["path"].startswith(self.exclude)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        token = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                token = value.decode("latin-1")
+                break
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+        if not token_matches(token, self.token):
+            await send_json(send, 403, "Invalid profile token")
+            return
+
+        status = None
+
+        async def discard(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        sampler = Sampler(
+            self.interval,
+            task=asyncio.current_task(),
+            label=f"{scope['method']} {scope['path']}",
+        )
+        sampler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            sampler.stop()
+
+        body = sampler.folded().encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-profile-status", str(status).encode()),
+                    (b"x-profile-duration", f"{sampler.duration:.3f}".encode()),
+                    (b"x-profile-samples", str(sampler.samples).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,193 @@
+import asyncio
+import math
+import time
+
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+
+
+class InMemoryRateLimitBackend:
+    """
+    Token buckets kept in process memory, so limits apply per worker.
+    """
+
+    # Buckets are pruned once there are more than this many keys
+    MAX_KEYS = 10_000
+
+    def __init__(self):
+        self.buckets = {}
+
+    async def take(self, key, rate, burst):
+        """
+        Take one token from the bucket for `key`.
+
+        Returns whether the request is allowed and, if not, how many seconds
+        until a token is available.
+        """
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+
+        if len(self.buckets) > self.MAX_KEYS:
+            self.prune(now, rate, burst)
+
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            return True, 0.0
+        self.buckets[key] = (tokens, now)
+        return False, (1 - tokens) / rate
+
+    def prune(self, now, rate, burst):
+        # A bucket that has refilled completely is the same as a missing one
+        full_after = burst / rate
+        self.buckets = {
+            key: (tokens, updated)
+            for key, (tokens, updated) in self.buckets.items()
+            if now - updated < full_after
+        }
+
+
+class MongoRateLimitBackend:
+    """
+    Token buckets shared by all workers, stored in a MongoDB collection.
+
+    Each `take` is a single atomic pipeline update using the server clock.
+    Idle buckets are removed by a TTL index, see `create_indexes`.
+    """
+
+    def __init__(self, collection, idle_ttl=3600):
+        self.collection = collection
+        self.idle_ttl = idle_ttl
+
+    async def create_indexes(self):
+        await self.collection.create_index("updated", expireAfterSeconds=self.idle_ttl)
+
+    async def take(self, key, rate, burst):
+        elapsed = {
+            "$divide": [
+                {"$subtract": ["$$NOW", {"$ifNull": ["$updated", "$$NOW"]}]},
+                1000,
+            ]
+        }
+        tokens = {"$ifNull": ["$tokens", burst]}
+        refilled = {"$min": [burst, {"$add": [tokens, {"$multiply": [elapsed, rate]}]}]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated": "$$NOW"}},
+                {
+                    "$set": {
+                        "allowed": {"$gte": ["$tokens", 1]},
+                        "tokens": {
+                            "$cond": [
+                                {"$gte": ["$tokens", 1]},
+                                {"$subtract": ["$tokens", 1]},
+                                "$tokens",
+                            ]
+                        },
+                    }
+                },
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return True, 0.0
+        return False, (1 - bucket["tokens"]) / rate
+
+
+# Identify the caller by its peer address. Client-supplied headers are not
+# used, since a caller could send a new value with every request. Behind a
+# reverse proxy, run uvicorn with --proxy-headers and --forwarded-allow-ips so
+# the address comes from the proxy's X-Forwarded-For.
+def client_key(request):
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """
+    Dependency enforcing a per-client token bucket and a concurrency cap.
+
+    Use one instance per router (`APIRouter(dependencies=[Depends(limit)])`)
+    or per route. Every instance has its own buckets and its own cap.
+
+    - `rate` / `burst`: tokens per second per client and bucket size.
+      Requests without a token get 429 with `Retry-After`.
+    - `max_concurrent`: requests allowed to run at once in this worker.
+      Others wait up to `queue_timeout` seconds. At most `max_queue` of them
+      wait, and requests beyond that are shed at once. Both cases get 503
+      with `Retry-After`.
+    - `charge`: whether the dependency takes the token. With `charge=False`
+      the route calls `await limit.charge(request)` itself, e.g. only once a
+      conditional GET turns out not to be answerable with 304.
+    """
+
+    def __init__(
+        self,
+        name,
+        backend,
+        rate=None,
+        burst=None,
+        max_concurrent=None,
+        queue_timeout=1.0,
+        max_queue=None,
+        charge=True,
+    ):
+        self.name = name
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.max_concurrent = max_concurrent
+        self.semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent else None
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue if max_queue is not None else max_concurrent
+        self.waiting = 0
+        self.auto_charge = charge
+
+    async def charge(self, request):
+        """Take a token for the caller, or raise 429 if it has none left."""
+        if self.rate is None:
+            return
+        allowed, retry_after = await self.backend.take(
+            f"{self.name}:{client_key(request)}", self.rate, self.burst
+        )
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    async def __call__(self, request: Request):
+        if self.auto_charge:
+            await self.charge(request)
+
+        if self.semaphore is None:
+            yield
+            return
+
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            self.overloaded()
+        self.waiting += 1
+        try:
+            # Not wait_for: it runs acquire() in a separate task that can take
+            # a permit just as the timeout fires, and that permit is never
+            # released
+            async with asyncio.timeout(self.queue_timeout):
+                await self.semaphore.acquire()
+        except TimeoutError:
+            self.overloaded()
+        finally:
+            self.waiting -= 1
+
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+    def overloaded(self):
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy",
+            headers={"Retry-After": str(max(1, math.ceil(self.queue_timeout)))},
+        )
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, time, timedelta, timezone
+
+from pymongo import DeleteMany, ReplaceOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from util.hk_time_now import HONG_KONG_TZ, server_now
+
+logger = logging.getLogger(__name__)
+
+# Changes are re-read for a short window before the watermark. Both come from
+# the MongoDB clock, but writes stamped just before the watermark may only
+# become visible after the changed days were read.
+ROLLUP_OVERLAP = timedelta(seconds=5)
+
+# Rollup dimensions and the bag field each one is grouped by. `all` has a
+# single key per day and backs the per-day totals.
+DIMENSIONS = {"officer": "$officer_id", "box": "$box_id", "all": None}
+
+# Registration day in Hong Kong time, e.g. "2024-04-23"
+REGISTRATION_DAY = {
+    "$dateToString": {
+        "format": "%Y-%m-%d",
+        "date": "$date_registered",
+        "timezone": "Asia/Hong_Kong",
+    }
+}
+
+
+# MongoDB returns naive UTC datetimes
+def as_utc(value):
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def registration_day(date_registered):
+    return as_utc(date_registered).astimezone(HONG_KONG_TZ).date()
+
+
+# Aggregation grouping the bags matched by `match` into one rollup document
+# per dimension, key and registration day
+def rollup_pipeline(bags, match):
+    branches = [
+        [
+            {"$match": match},
+            {
+                "$group": {
+                    "_id": {
+                        "dimension": dimension,
+                        "key": key,
+                        "day": REGISTRATION_DAY,
+                    },
+                    "count": {"$sum": 1},
+                    "registered_ms": {"$sum": {"$toLong": "$date_registered"}},
+                }
+            },
+            {
+                "$set": {
+                    "dimension": "$_id.dimension",
+                    "key": "$_id.key",
+                    "day": "$_id.day",
+                }
+            },
+        ]
+        for dimension, key in DIMENSIONS.items()
+    ]
+    first, *rest = branches
+    return first + [
+        {"$unionWith": {"coll": bags.name, "pipeline": branch}} for branch in rest
+    ]
+
+
+class BagRollup:
+    """
+    Bag counts and registration times per officer, box and day, kept in the
+    `bag_rollup` collection so reports never scan `bags`.
+
+    Each refresh recomputes only the registration days of bags changed or
+    deleted since the last watermark. Deleted bags are found through their
+    tombstones, which keep `date_registered`. A full rebuild runs on request
+    and at least every `full_interval`. It also corrects days left stale when
+    an update moved a bag's `date_registered` to another day.
+
+    Refreshes take a lease in `report_state`, so only one worker runs them
+    at a time.
+    """
+
+    def __init__(
+        self,
+        db,
+        bags,
+        tombstones,
+        interval=60,
+        full_interval=timedelta(days=1),
+        lease=timedelta(minutes=10),
+    ):
+        self.db = db
+        self.bags = bags
+        self.tombstones = tombstones
+        self.collection = db.get_collection("bag_rollup")
+        self.state = db.get_collection("report_state")
+        self.interval = interval
+        self.full_interval = full_interval
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    async def create_indexes(self, collection=None):
+        collection = collection if collection is not None else self.collection
+        await collection.create_index([("dimension", 1), ("day", 1)])
+
+    async def status(self):
+        return await self.state.find_one({"_id": self.collection.name}) or {}
+
+    async def refresh(self, full=False):
+        """
+        Bring the rollup up to date. Returns the new state, or None if another
+        worker holds the lease.
+        """
+        async with self._lock:
+            if not await self._acquire_lease():
+                return None
+            try:
+                state = await self.status()
+                started = await server_now(self.db)
+                update = {"watermark": started}
+                last_full = state.get("last_full")
+                if (
+                    full
+                    or state.get("watermark") is None
+                    or last_full is None
+                    or started - as_utc(last_full) > self.full_interval
+                ):
+                    await self._rebuild()
+                    update["last_full"] = started
+                else:
+                    await self._update_days(as_utc(state["watermark"]) - ROLLUP_OVERLAP)
+                await self.state.update_one(
+                    {"_id": self.collection.name}, {"$set": update}
+                )
+                return {**state, **update}
+            finally:
+                await self._release_lease()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except PyMongoError:
+                logger.exception("Bag rollup refresh failed")
+            await asyncio.sleep(self.interval)
+
+    async def _acquire_lease(self):
+        now = datetime.now(timezone.utc)
+        try:
+            await self.state.update_one(
+                {
+                    "_id": self.collection.name,
+                    "$or": [
+                        {"lease_owner": self.owner},
+                        {"lease_expires": None},
+                        {"lease_expires": {"$lt": now}},
+                    ],
+                },
+                {
+                    "$set": {
+                        "lease_owner": self.owner,
+                        "lease_expires": now + self.lease,
+                    }
+                },
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _release_lease(self):
+        await self.state.update_one(
+            {"_id": self.collection.name, "lease_owner": self.owner},
+            {"$set": {"lease_owner": None, "lease_expires": None}},
+        )
+
+    async def _rebuild(self):
+        # Build into a scratch collection and swap it in, so reports never see
+        # a half-built rollup
+        rebuild = self.db.get_collection(self.collection.name + "_rebuild")
+        await self.bags.aggregate(
+            rollup_pipeline(self.bags, {}) + [{"$out": rebuild.name}]
+        ).to_list(None)
+        await self.create_indexes(rebuild)
+        await rebuild.rename(self.collection.name, dropTarget=True)
+
+    async def _update_days(self, since):
+        days = set()
+        async for bag in self.bags.find(
+            {"last_updated": {"$gt": since}}, {"date_registered": 1}
+        ):
+            if bag.get("date_registered") is not None:
+                days.add(registration_day(bag["date_registered"]))
+        async for tomb in self.tombstones.find(
+            {"collection": self.bags.name, "deleted_at": {"$gt": since}},
+            {"date_registered": 1},
+        ):
+            if tomb.get("date_registered") is not None:
+                days.add(registration_day(tomb["date_registered"]))
+        if not days:
+            return
+
+        ranges = []
+        for day in days:
+            start = datetime.combine(day, time(), HONG_KONG_TZ)
+            ranges.append(
+                {"date_registered": {"$gte": start, "$lt": start + timedelta(days=1)}}
+            )
+        groups = await self.bags.aggregate(
+            rollup_pipeline(self.bags, {"$or": ranges})
+        ).to_list(None)
+
+        # Replace the groups of the affected days and remove the ones that
+        # no longer have any bags
+        await self.collection.bulk_write(
+            [ReplaceOne({"_id": group["_id"]}, group, upsert=True) for group in groups]
+            + [
+                DeleteMany(
+                    {
+                        "day": {"$in": [day.isoformat() for day in days]},
+                        "_id": {"$nin": [group["_id"] for group in groups]},
+                    }
+                )
+            ],
+            ordered=False,
+        )
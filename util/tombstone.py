@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+# How long deletions are remembered for delta sync. Clients whose checkpoint
+# is older than this have to do a full resync.
+TOMBSTONE_TTL = timedelta(days=30)
+
+
+# Create the record left behind when a document is deleted. Extra fields are
+# kept for consumers that need to know more than the id (e.g. report rollups).
+def tombstone(collection, document_id, **fields):
+    return {
+        "collection": collection,
+        "document_id": str(document_id),
+        **fields,
+    }
+
+
+# Insert tombstones with `deleted_at` set by the MongoDB clock, the same clock
+# that stamps `last_updated`. Inserts cannot use `$$NOW`, so each tombstone is
+# written as an upsert of a new id.
+async def insert_tombstones(collection, tombstones, session=None):
+    await collection.bulk_write(
+        [
+            UpdateOne(
+                {"_id": ObjectId()},
+                [
+                    {
+                        "$set": {
+                            **{key: {"$literal": value} for key, value in t.items()},
+                            "deleted_at": "$$NOW",
+                        }
+                    }
+                ],
+                upsert=True,
+            )
+            for t in tombstones
+        ],
+        session=session,
+    )
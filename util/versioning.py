@@ -0,0 +1,77 @@
+from fastapi import HTTPException
+
+from util.compression import CODINGS
+
+
+# Strong ETag of a single document, from its `version`
+def version_etag(version):
+    return f'"{version}"'
+
+
+# Versions listed in an If-Match header, e.g. `"3"` or `"3", "4"`. Content
+# coding suffixes added by CompressionMiddleware are ignored. If-Match uses
+# strong comparison, so weak `W/` tags never match. Returns None for `*`,
+# which only requires the document to exist.
+def if_match_versions(header):
+    if header.strip() == "*":
+        return None
+    versions = []
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            continue
+        candidate = candidate.strip('"')
+        for coding in CODINGS:
+            candidate = candidate.removesuffix(f"-{coding}")
+        try:
+            versions.append(int(candidate))
+        except ValueError:
+            # Not an ETag we handed out, so it cannot match
+            pass
+    return versions
+
+
+class VersionCheck:
+    """
+    The version a PUT expects the document to be at.
+
+    Taken from the If-Match header when present, otherwise from the `version`
+    field of the body. Without either the update is unconditional.
+    """
+
+    def __init__(self, request, body_version=None):
+        header = request.headers.get("if-match")
+        self.precondition = header is not None
+        if header is not None:
+            self.versions = if_match_versions(header)
+        elif body_version is not None:
+            self.versions = [body_version]
+        else:
+            self.versions = None
+
+    # Filter to add to the update's query. Documents written before versions
+    # existed have no `version` and count as version 0.
+    def filter(self):
+        if self.versions is None:
+            return {}
+        versions = list(self.versions)
+        if 0 in versions:
+            versions.append(None)
+        return {"version": {"$in": versions}}
+
+    async def failure(self, collection, query, name, id):
+        """
+        The error for an update whose filter matched nothing: 404 if the
+        document does not exist, otherwise 412 for a failed If-Match or 409
+        for a stale body version. The current version is returned as `ETag`
+        so the client can retry without reading the document again.
+        """
+        current = await collection.find_one(query, {"version": 1})
+        if current is None:
+            return HTTPException(status_code=404, detail=f"{name} {id} not found")
+        version = current.get("version", 0)
+        return HTTPException(
+            status_code=412 if self.precondition else 409,
+            detail=f"{name} {id} was modified, it is at version {version}",
+            headers={"ETag": version_etag(version)},
+        )
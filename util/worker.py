@@ -0,0 +1,21 @@
+from uvicorn.workers import UvicornWorker
+
+# Seconds of gunicorn's graceful timeout kept for the app's shutdown handlers
+SHUTDOWN_MARGIN = 10
+
+
+class Worker(UvicornWorker):
+    """
+    Uvicorn worker for gunicorn with a bounded wait for open requests.
+
+    On shutdown, requests still running after `graceful_timeout` minus
+    `SHUTDOWN_MARGIN` seconds are cancelled. Event streams never finish on
+    their own. This leaves time for the shutdown handlers (flushing the audit
+    log, closing the database client) before gunicorn kills the worker.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = max(
+            1, self.cfg.graceful_timeout - SHUTDOWN_MARGIN
+        )